@@ -1,173 +1,43 @@
-import numpy as np
-from operator import itemgetter
-
-# global from : https://mathcenter.oxford.emory.edu/site/math125/englishLetterFreqs/
-
-# The most common letters in English in order:
-commonFreq = "ETAOINSHRDLCUMWFGYPBVKJXQZ"
-# And their frequencies: 
-lcf = [c for c in commonFreq]
-commonVals = [
-    0.12702,
-    0.09056,
-    0.08167,
-    0.07507,
-    0.06966,
-    0.06749,
-    0.06327,
-    0.06094,
-    0.05987,
-    0.04253,
-    0.04025,
-    0.02782,
-    0.02758,
-    0.02406,
-    0.02360,
-    0.02228,
-    0.02015,
-    0.01974,
-    0.01929,
-    0.01492,
-    0.00978,
-    0.00772,
-    0.00153,
-    0.00150,
-    0.00095,
-    0.00074,
-]
-
-# Calculating the freq. of each letter in the cipher text and return a dictionary with result
-def freq(cipher: str) -> dict:
-    d = {}
-    ignore = {}
-    for ch in cipher:
-        if ch.isalpha():
-            if ch in d:
-                d[ch] += 1
-            else:
-                d[ch] = 1
-        else:
-            if ch in ignore:
-                ignore[ch] += 1
-            else:
-                ignore[ch] = 1
-    
-    # Add missing letters with 0 frequency to avoid errors
-    for c in "ABCDEFGHIJKLMNOPQRSTUVWXYZ":
-        if c not in d:
-            d[c] = 0
-
-    for x in d:
-        d[x] /= len(cipher) - sum(list(ignore.values()))
-    return d
-
-# Using our freq. analysis result to do the first round of decryption
-def crack(cipher: str) -> str:
-    mapOfFreq = freq(cipher)
-
-    letterKeys = list(mapOfFreq.keys())
-    lettervals = list(mapOfFreq.values())
+from cipherCore import KeyHistory, decode, initial_reciprocal_mapping_by_frequency, letter_freq, ngram_stats
 
-    # Debugging purposes:
-    # print(f"DEBUG: Sum of values : {sum(lettervals)}")
+# Using our freq. analysis result to do the first round of decryption, returns the decryption and the key
+def crack(cipher: str) -> tuple:
+    mapOfFreq = letter_freq(cipher)
 
-    sortedMap = sorted(zip(letterKeys, lettervals), key=itemgetter(1), reverse=True)
+    sortedMap = sorted(mapOfFreq.items(), key=lambda item: item[1], reverse=True)
 
     print("\nSorted Map of Cipher Letter Frequencies:")
     print(sortedMap)
 
-    cipher_to_common = {}
-    usedL = set()
-    i = 0
-    j = 0
-
-    while i < len(sortedMap) and j < len(commonFreq):
-
-        cipher_letter = sortedMap[i][0]
-        common_letter = commonFreq[j]
-
-        # if either letter is already used, skip to the next one
-        if cipher_letter in usedL:
-            i += 1
-            continue
-
-        if common_letter in usedL:
-            j += 1
-            continue
+    # reciprocal pairs: most frequent cipher letter <-> most frequent english letter and so on
+    mapping = initial_reciprocal_mapping_by_frequency(cipher)
 
-        # this is to avoid having the same letter map to itself and have bugs down the line like (C -> C) and (C -> D) at the same time
-        if cipher_letter == common_letter:
-            i += 1
-            continue
+    print("\n", {c: p for c, p in mapping.items() if c != p})
 
-        cipher_to_common[cipher_letter] = common_letter
-        cipher_to_common[common_letter] = cipher_letter
+    return decode(cipher, mapping), mapping
 
-        usedL.add(cipher_letter)
-        usedL.add(common_letter)
-
-        i += 1
-        j += 1
-
-    print("\n", cipher_to_common)
-
-    char_list = []
-
-    global history
-
-    history = cipher_to_common
-
-    for c in cipher:
-        if not c.isalpha():
-            char_list.append(c)
-        else:
-            char_list.append(cipher_to_common[c])
-    decrypt = "".join(char_list)
-    return decrypt
-
-# function for manual swapping of letters
-def manualSwap(change):
-    global history
-
-    a = change[0]
-    b = change[1]
-
-    a_partner = history[a]
-    b_partner = history[b]
-
-    history[a_partner] = b
-    history[b_partner] = a
-
-    history[a] = b_partner
-    history[b] = a_partner
-
-# optional function the user can use to see top 3 trigrams in the CT
+# optional function the user can use to see top 3 trigrams in the CT (3-letter words only)
 def find_trigrams(ct: str) -> dict:
-    d = {} 
-    words = ct.split()
-    
-    for word in words:
-        if len(word) == 3:
-            if word in d:
-                d[word] += 1
-            else:
-                d[word] = 1
-
-    # after seeing how many times every 3-letter word shows, we get the top 3
-    top_3_trigrams = sorted(d.items(), key=lambda item: item[1], reverse=True)[:3]
-
-    return dict(top_3_trigrams)
+    return dict(ngram_stats(ct).top(3, 3, mode="word"))
+
+# YH swaps what Y and H decode to: Y takes H's old partner and H takes Y's, the key stays reciprocal
+def swap(history: KeyHistory, a: str, b: str) -> tuple:
+    b_partner = history.key[b]
+    if b_partner == a:
+        # partners of each other, after the swap both decode to themselves
+        mapping = dict(history.key)
+        mapping[a], mapping[b] = a, b
+        return history.replace(mapping)
+    return history.associate(a, b_partner)
 
 def main():
     ct = input("Enter the Cipher Text: ")
-    decrypt = crack(ct.upper())
+    decrypt, mapping = crack(ct.upper())
 
     # 2 print statements like this to avoid the one extra whitespace before the result
     print("\n")
     print(decrypt)
 
-    global history
-
     while True:
         ans = input("\n-- Want to see the top 3 trigrams? (Y/n): ")
         if ans == 'Y' or ans == 'y':
@@ -185,14 +55,21 @@ def main():
         else:
             break
 
-    print("\n*** Type 'DONE' to stop ***")
+    # every change is kept as a small delta so UNDO can step back through them
+    history = KeyHistory(mapping)
+
+    print("\n*** Type 'DONE' to stop, 'UNDO' to take back the last change ***")
     while True:
-        ans = input("\nWhat do you want to change? (eg., YH or DONE): ")
+        ans = input("\nWhat do you want to change? (eg., YH, UNDO or DONE): ")
 
         if ans == "DONE" or ans == "done":
             print("\n\n\n\n-- Your Final Decryption -------------\n")
             print(decrypt)
             break
+        elif ans == "UNDO" or ans == "undo":
+            if not history.undo():
+                print("Nothing to undo")
+                continue
         else:
             change = ans.upper()
 
@@ -204,20 +81,12 @@ def main():
                 print("Only alphabets pls")
                 continue
 
-            manualSwap(change=change)
+            swap(history, change[0], change[1])
 
-            char_list = []
+        decrypt = decode(ct, history.key)
 
-            for c in ct:
-                if not c.isalpha():
-                    char_list.append(c)
-                else:
-                    char_list.append(history[c])
-
-            decrypt = "".join(char_list)
-
-            print("\n-- NEW RESULT -------------")
-            print(decrypt)
+        print("\n-- NEW RESULT -------------")
+        print(decrypt)
 
 
 if __name__ == "__main__":
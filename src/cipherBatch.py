@@ -0,0 +1,220 @@
+"""
+Non interactive batch cracking
+
+usage : python cipherBatch.py INPUT [INPUT ...] [-o results.jsonl] [--workers N] [--method anneal|steepest]
+
+INPUT can be
+    a directory        - every file inside is one ciphertext (id = file name)
+    a .jsonl file / -  - one {"id": ..., "ciphertext": ...} object per line (- reads stdin)
+    any other file     - one ciphertext per non empty line (id = file:line)
+
+Solves are fanned out over a process pool sized to the core count. The n-gram model is memory mapped
+by every worker from the on disk cache (built once by the parent first) so the tables are shared through
+the page cache and never pickled into tasks, a task only carries its id and ciphertext.
+Results are written as JSONL in completion order: id, key, plaintext, score, coverage, elapsed, method.
+A record that cannot be solved (bad JSON, no string "ciphertext", a failed solve) gets {"id", "error"} and the rest go on.
+Ciphertexts solved before come straight from the solve cache (cipherCache, "cached": true in the result),
+--refine solves them again with a longer search and updates the cache when that finds a better key, --no-cache skips it.
+--profile [PREFIX] (or CIPHER_PROFILE) times the hot paths inside the workers too, every result carries its
+counters back to the parent which prints the summary at the end (see cipherProfile.py).
+
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from cipherCache import SolveCache, fingerprint
+from cipherCore import decode, key_from_string, key_string
+from cipherModel import load_flat_model
+from cipherProfile import enabled, install, merge, report, setup, snapshot, span
+from cipherSolver import METHODS, REFINE_ITERATIONS, REFINE_RESTARTS, solve
+from cipherWords import coverage, word_set
+
+
+class BadRecord(ValueError):
+    """An input record that cannot be solved, it is reported in the results instead of a key."""
+
+
+def parse_record(line: str, default_id: str) -> tuple:
+    #(id, ciphertext) of one .jsonl line, the ciphertext is a BadRecord when the line is not a usable record
+    try:
+        obj = json.loads(line)
+    except ValueError as e:
+        return default_id, BadRecord(f"invalid JSON: {e}")
+    if not isinstance(obj, dict):
+        return default_id, BadRecord("record must be a JSON object")
+    cid = str(obj.get("id", default_id))
+    if "ciphertext" not in obj:
+        return cid, BadRecord("missing 'ciphertext'")
+    if not isinstance(obj["ciphertext"], str):
+        return cid, BadRecord("'ciphertext' must be a string")
+    return cid, obj["ciphertext"]
+
+
+def read_items(paths: list):
+    #yields (id, ciphertext) from every input in order, records that cannot be used come with a BadRecord instead
+    for path in paths:
+        if path == "-" or path.endswith(".jsonl"):
+            f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+            try:
+                for n, line in enumerate(f, start=1):
+                    if line.strip():
+                        yield parse_record(line, f"{path}:{n}")
+            finally:
+                if f is not sys.stdin:
+                    f.close()
+        elif os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                full = os.path.join(path, name)
+                if os.path.isfile(full):
+                    try:
+                        with open(full, encoding="utf-8") as f:
+                            yield name, f.read()
+                    except (OSError, UnicodeDecodeError) as e:
+                        yield name, BadRecord(f"cannot read {full}: {e}")
+        else:
+            with open(path, encoding="utf-8") as f:
+                for n, line in enumerate(f, start=1):
+                    if line.strip():
+                        yield f"{path}:{n}", line.rstrip("\n")
+
+
+def init_worker(profile: bool = False) -> None:
+    #runs once per worker process: map the model and load the word list before the first task
+    if profile:
+        install()
+    load_flat_model()
+    word_set()
+
+
+def crack_one(item: tuple, refine: bool = False, method: str = "anneal") -> dict:
+    cid, ct = item
+    start = time.perf_counter()
+    with span("crack"):
+        if refine:
+            mapping, score = solve(ct, restarts=REFINE_RESTARTS, iterations=REFINE_ITERATIONS, target=None, method=method)
+        else:
+            mapping, score = solve(ct, method=method)
+        plain = decode(ct, mapping)
+        result = {
+            "id": cid,
+            "key": key_string(mapping),
+            "plaintext": plain,
+            "score": score,
+            "coverage": coverage(plain)[1],
+            "elapsed": time.perf_counter() - start,
+            "method": method,
+        }
+    if enabled():
+        #counters of this task only, merged into the parent's by run_batch
+        result["profile"] = snapshot(reset=True)
+    return result
+
+
+def cached_result(cid: str, ct: str, hit: dict) -> dict:
+    plain = decode(ct, key_from_string(hit["key"]))
+    return {"id": cid, "key": hit["key"], "plaintext": plain, "score": hit["score"], "coverage": hit["coverage"],
+            "elapsed": 0.0, "method": hit["method"], "cached": True}
+
+
+def run_batch(items, out, workers: int = None, cache: SolveCache = None, refine: bool = False,
+              method: str = "anneal") -> int:
+    """
+    Solve every (id, ciphertext) of items, writing one JSON line per result to out as soon as it is done.
+    An item that cannot be solved (a BadRecord, or a solve that raised) gets an {"id", "error"} line instead
+    and the batch goes on, the return value counts the solved items only.
+
+    With a cache, known ciphertexts are answered from it without a solve (unless refine) and every new
+    or better result is stored, only this process ever touches the cache.
+    """
+    workers = workers or os.cpu_count() or 1
+    #build the cache here so the workers only ever read it
+    load_flat_model()
+    done = 0
+
+    def emit(result: dict) -> None:
+        nonlocal done
+        out.write(json.dumps(result) + "\n")
+        out.flush()
+        if "error" not in result:
+            done += 1
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(enabled(),)) as pool:
+        #future -> (id, ciphertext, fingerprint, cached result) for the cache update once it is done
+        pending = {}
+        items = iter(items)
+        exhausted = False
+        while pending or not exhausted:
+            #keep a couple of tasks queued per worker without reading the whole input up front
+            while not exhausted and len(pending) < 2 * workers:
+                item = next(items, None)
+                if item is None:
+                    exhausted = True
+                    continue
+                if not isinstance(item[1], str):
+                    error = item[1] if isinstance(item[1], BadRecord) else "'ciphertext' must be a string"
+                    emit({"id": item[0], "error": str(error)})
+                    continue
+                fp = hit = None
+                if cache is not None:
+                    fp = fingerprint(item[1])
+                    hit = cache.get(fp)
+                    if hit is not None and not refine:
+                        emit(cached_result(item[0], item[1], hit))
+                        continue
+                pending[pool.submit(crack_one, item, refine, method)] = (item[0], item[1], fp, hit)
+            if not pending:
+                break
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                cid, ct, fp, hit = pending.pop(fut)
+                try:
+                    result = fut.result()
+                except Exception as e:
+                    emit({"id": cid, "error": f"{type(e).__name__}: {e}"})
+                    continue
+                if "profile" in result:
+                    merge(result.pop("profile"))
+                if cache is not None and not cache.put(fp, result["key"], result["coverage"], result["score"],
+                                                       result["plaintext"], method) and hit is not None:
+                    #an earlier run had found a better key
+                    result = cached_result(result["id"], ct, hit)
+                emit(result)
+    return done
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crack many reciprocal ciphertexts in parallel.")
+    parser.add_argument("inputs", nargs="+", help="directory, .jsonl file, - for stdin, or text file")
+    parser.add_argument("-o", "--out", help="results file (JSONL), stdout when omitted")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--no-cache", action="store_true", help="always solve, never read or update the solve cache")
+    parser.add_argument("--refine", action="store_true",
+                        help="solve cached ciphertexts again with a longer search, keeping the better key")
+    parser.add_argument("--method", choices=METHODS, default="anneal",
+                        help="anneal (random restarts, default) or steepest (deterministic best swap climbing)")
+    parser.add_argument("--profile", nargs="?", const="", metavar="PREFIX",
+                        help="print where the time went, PREFIX.pstats / PREFIX.collapsed too when given")
+    args = parser.parse_args()
+    if args.profile is not None:
+        install(args.profile or None)
+    else:
+        setup([])
+
+    out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+    try:
+        start = time.perf_counter()
+        cache = None if args.no_cache else SolveCache()
+        n = run_batch(read_items(args.inputs), out, args.workers, cache, args.refine, args.method)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"Cracked {n} ciphertexts in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    report()
+
+
+if __name__ == "__main__":
+    main()
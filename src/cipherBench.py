@@ -0,0 +1,251 @@
+"""
+Benchmarks of the core cipher operations and of the solver
+
+usage : python cipherBench.py [--sizes 100,10k,1M,10M] [--no-solver] [-o results.json] [--compare baseline.json]
+
+Texts are synthetic (cipherCorpus): random words_alpha.txt words encrypted with a random reciprocal key, from 100 characters up
+to whatever --sizes asks for (100M works, it just takes a while and a few hundred MB of memory).
+Every operation is timed best of --repeat rounds, each round looping it long enough to be measurable.
+
+    letter_freq, top_trigrams, keyed n-gram stats (NgramStats), decode (dict key), decode (ReciprocalKey),
+    initial_reciprocal_mapping_by_frequency                                                                           per text size
+    associate (dict), associate (ReciprocalKey)                                                                        once
+    solver moves/s (IncrementalScorer.propose) and time to solve() with its accuracy                                   per ciphertext length
+    population keys/s (EncodedCipher.score_keys over 325 neighbours)                                                  per ciphertext length
+
+Results are written as JSON ({"meta": ..., "results": {"op/size": {"seconds": ..., ...}}}), --compare prints the ratio
+against an earlier results file and exits with status 1 when anything got slower than --threshold.
+
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from cipherCore import (
+    ALPHABET,
+    associate,
+    decode,
+    initial_reciprocal_mapping_by_frequency,
+    letter_freq,
+    top_trigrams,
+)
+from cipherCorpus import plain_text, random_involution
+from cipherVec import NgramStats, key_table
+
+DEFAULT_SIZES = "100,10k,1M,10M"
+SOLVER_LENGTHS = (100, 250, 500, 1000, 2000)
+SOLVER_MOVES = 5000
+#a round of a fast operation is looped until it takes at least this long
+MIN_ROUND = 0.05
+
+SUFFIXES = {"k": 10 ** 3, "m": 10 ** 6, "g": 10 ** 9}
+
+
+def parse_size(text: str) -> int:
+    text = text.strip().lower()
+    if text[-1:] in SUFFIXES:
+        return int(float(text[:-1]) * SUFFIXES[text[-1]])
+    return int(text)
+
+
+def size_label(n: int) -> str:
+    for suffix, scale in (("G", 10 ** 9), ("M", 10 ** 6), ("k", 10 ** 3)):
+        if n >= scale and n % scale == 0:
+            return f"{n // scale}{suffix}"
+    return str(n)
+
+
+def measure(fn, repeat: int = 5) -> dict:
+    """Best and median seconds per call of fn over `repeat` rounds."""
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        took = time.perf_counter() - start
+        if took >= MIN_ROUND or loops >= 1 << 20:
+            break
+        loops *= 10 if took < MIN_ROUND / 10 else 2
+    times = [took / loops]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        times.append((time.perf_counter() - start) / loops)
+    times.sort()
+    return {"seconds": times[0], "median": times[len(times) // 2], "loops": loops}
+
+
+def bench_text_ops(sizes: list, rng: random.Random, repeat: int, results: dict) -> None:
+    key = random_involution(rng)
+    key_dict = dict(key)
+    for n in sizes:
+        ct = decode(plain_text(n, rng), key)
+        label = size_label(n)
+        #what every show pays once the ciphertext n-grams are counted: trigrams, bigrams and doubles under a key
+        stats = NgramStats(ct)
+        table = key_table(key_dict)
+        ops = {
+            "letter_freq": lambda: letter_freq(ct),
+            "top_trigrams": lambda: top_trigrams(ct),
+            "mapped_ngrams": lambda: (stats.top(3, table=table), stats.top(2, table=table), stats.doubles(table=table)),
+            "decode_dict": lambda: decode(ct, key_dict),
+            "decode_key": lambda: decode(ct, key),
+            "mapping_by_frequency": lambda: initial_reciprocal_mapping_by_frequency(ct),
+        }
+        for name, fn in ops.items():
+            r = measure(fn, repeat)
+            r["chars_per_s"] = n / r["seconds"]
+            results[f"{name}/{label}"] = r
+            report(f"{name}/{label}", r)
+        del ct
+
+
+def bench_associate(rng: random.Random, repeat: int, results: dict) -> None:
+    pairs = [tuple(rng.sample(ALPHABET, 2)) for _ in range(1000)]
+    mapping = dict(random_involution(rng))
+    key = random_involution(rng)
+
+    def on_dict():
+        for a, b in pairs:
+            associate(mapping, a, b)
+
+    def on_key():
+        for a, b in pairs:
+            key.associate(a, b)
+
+    for name, fn in (("associate_dict", on_dict), ("associate_key", on_key)):
+        r = measure(fn, repeat)
+        r["seconds"] /= len(pairs)
+        r["median"] /= len(pairs)
+        results[name] = r
+        report(name, r)
+
+
+def bench_solver(lengths, rng: random.Random, results: dict) -> None:
+    from cipherModel import load_flat_model
+    from cipherSolver import EncodedCipher, IncrementalScorer, neighbour_keys, random_pair, solve
+    load_flat_model()
+    for n in lengths:
+        plain = plain_text(n, rng).upper()
+        key = random_involution(rng)
+        ct = decode(plain, key)
+        label = size_label(n)
+
+        scorer = IncrementalScorer(ct, initial_reciprocal_mapping_by_frequency(ct))
+        moves = [random_pair(rng) for _ in range(SOLVER_MOVES)]
+        start = time.perf_counter()
+        for a, b in moves:
+            scorer.propose(a, b)
+        took = time.perf_counter() - start
+        results[f"solver_moves/{label}"] = r = {"seconds": took / SOLVER_MOVES, "moves_per_s": SOLVER_MOVES / took}
+        report(f"solver_moves/{label}", r)
+
+        cipher = EncodedCipher(ct)
+        population = neighbour_keys(scorer.key[:26])
+        r = measure(lambda: cipher.score_keys(population))
+        r["keys_per_s"] = len(population) / r["seconds"]
+        r["seconds"] /= len(population)
+        r["median"] /= len(population)
+        results[f"population_keys/{label}"] = r
+        report(f"population_keys/{label}", r)
+
+        start = time.perf_counter()
+        found, score = solve(ct, seed=0)
+        took = time.perf_counter() - start
+        got = decode(ct, found)
+        accuracy = sum(a == b for a, b in zip(got, plain)) / max(len(plain), 1)
+        results[f"solve/{label}"] = r = {"seconds": took, "score": score, "accuracy": accuracy, "solved": got == plain}
+        report(f"solve/{label}", r)
+
+
+def report(name: str, r: dict) -> None:
+    extra = "   ".join(f"{k} {v:,.0f}" for k, v in r.items() if k.endswith("_per_s"))
+    if "accuracy" in r:
+        extra = f"accuracy {r['accuracy']:.0%}"
+    print(f"  {name:<30}{format_seconds(r['seconds']):>12}   {extra}")
+
+
+def format_seconds(s: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if s >= scale:
+            return f"{s / scale:.2f} {unit}"
+    return f"{s / 1e-9:.0f} ns"
+
+
+def metadata() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> bool:
+    """Prints new / old time of every benchmark both runs have, returns True when one got slower than threshold."""
+    print(f"\nCompared with {baseline['meta'].get('commit') or 'baseline'} ({baseline['meta'].get('time', '?')})")
+    slower = False
+    for name, r in results.items():
+        old = baseline["results"].get(name)
+        if old is None:
+            continue
+        ratio = r["seconds"] / old["seconds"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag, slower = "  SLOWER", True
+        elif ratio < 1 / (1 + threshold):
+            flag = "  faster"
+        print(f"  {name:<30}{format_seconds(old['seconds']):>12} ->{format_seconds(r['seconds']):>12}   x{ratio:.2f}{flag}")
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the core cipher operations and the solver.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"text sizes in characters (default {DEFAULT_SIZES})")
+    parser.add_argument("--repeat", type=int, default=5, help="timing rounds per operation, the best counts")
+    parser.add_argument("--no-solver", action="store_true", help="skip the solver benchmarks")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic texts and keys")
+    parser.add_argument("-o", "--out", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="slowdown that counts as a regression (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    results = {}
+    print("Text operations")
+    bench_text_ops([parse_size(s) for s in args.sizes.split(",")], rng, args.repeat, results)
+    print("Key operations (per associate)")
+    bench_associate(rng, args.repeat, results)
+    if not args.no_solver:
+        print("Solver")
+        bench_solver(SOLVER_LENGTHS, rng, results)
+
+    run = {"meta": metadata(), "results": results}
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(run, f, indent=1)
+        print(f"\nResults written to {args.out}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
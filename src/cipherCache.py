@@ -0,0 +1,120 @@
+"""
+Persistent cache of solve results, keyed by a fingerprint of the ciphertext
+
+The fingerprint is the sha256 of the normalized ciphertext (upper case, whitespace runs collapsed to one space,
+trimmed) so the same intercept resubmitted with other line breaks or case still hits. It is computed chunk by
+chunk, a memory mapped file fingerprints the same as the text read into a string.
+
+Entries (key in the 26 letter form, dictionary coverage, n-gram score, plaintext, method) live in one SQLite file
+next to the n-gram model. put() only replaces an entry with a better result (higher coverage, then higher score,
+the solver's own ranking), so a longer later run refines what an earlier quick one found. Every hit marks the entry
+as used and past max_entries the least recently used entries are dropped.
+
+"""
+import hashlib
+import os
+import sqlite3
+import time
+
+from cipherModel import CACHE_DIR
+from cipherVec import iter_chunks
+
+CACHE_VERSION = 1
+MAX_ENTRIES = 10000
+#plaintexts are stored up to this many characters, the full text is always one decode of the key away
+MAX_PLAIN = 1 << 16
+
+
+def cache_path(cache_dir: str = CACHE_DIR) -> str:
+    return os.path.join(cache_dir, f"solves-v{CACHE_VERSION}.sqlite")
+
+
+def fingerprint(source, chunk_size: int = 1 << 20) -> str:
+    """sha256 hex of the normalized text of source (str, bytes, memory map or file object)."""
+    h = hashlib.sha256()
+    started = False
+    #whitespace seen since the last word, written as one space before the next word
+    pending = False
+    for chunk in iter_chunks(source, chunk_size):
+        data = (chunk.encode("utf-8") if isinstance(chunk, str) else bytes(chunk)).upper()
+        if not data:
+            continue
+        if data[:1].isspace():
+            pending = True
+        #a word cut in two by the chunk boundary carries on without a space
+        for i, part in enumerate(data.split()):
+            if started and (pending or i > 0):
+                h.update(b" ")
+            h.update(part)
+            started = True
+            pending = False
+        if data[-1:].isspace():
+            pending = True
+    return h.hexdigest()
+
+
+class SolveCache:
+    """
+    fingerprint -> best known result, in SQLite.
+
+    get() returns {"key", "coverage", "score", "plaintext", "method"} or None, put() stores a result unless the
+    cached one is at least as good and returns whether it did.
+    """
+
+    def __init__(self, path: str = None, max_entries: int = MAX_ENTRIES):
+        path = path or cache_path()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_entries = max_entries
+        self.db = sqlite3.connect(path)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS solves (
+                fingerprint TEXT PRIMARY KEY,
+                key TEXT NOT NULL,
+                coverage REAL NOT NULL,
+                score REAL NOT NULL,
+                plaintext TEXT NOT NULL,
+                method TEXT NOT NULL,
+                updated REAL NOT NULL,
+                used REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS solves_used ON solves (used)")
+        self.db.commit()
+
+    def get(self, fp: str):
+        row = self.db.execute("SELECT key, coverage, score, plaintext, method FROM solves WHERE fingerprint = ?",
+                              (fp,)).fetchone()
+        if row is None:
+            return None
+        self.db.execute("UPDATE solves SET used = ?, hits = hits + 1 WHERE fingerprint = ?", (time.time(), fp))
+        self.db.commit()
+        return dict(zip(("key", "coverage", "score", "plaintext", "method"), row))
+
+    def put(self, fp: str, key: str, coverage: float, score: float, plaintext: str, method: str = "solve") -> bool:
+        now = time.time()
+        cur = self.db.execute("""
+            INSERT INTO solves (fingerprint, key, coverage, score, plaintext, method, updated, used)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (fingerprint) DO UPDATE SET
+                key = excluded.key, coverage = excluded.coverage, score = excluded.score,
+                plaintext = excluded.plaintext, method = excluded.method, updated = excluded.updated, used = excluded.used
+            WHERE (excluded.coverage, excluded.score) > (solves.coverage, solves.score)""",
+            (fp, key, coverage, score, plaintext[:MAX_PLAIN], method, now, now))
+        stored = cur.rowcount > 0
+        if stored:
+            self._evict()
+        self.db.commit()
+        return stored
+
+    def _evict(self) -> None:
+        #least recently used first
+        extra = len(self) - self.max_entries
+        if extra > 0:
+            self.db.execute("DELETE FROM solves WHERE fingerprint IN "
+                            "(SELECT fingerprint FROM solves ORDER BY used LIMIT ?)", (extra,))
+
+    def __len__(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM solves").fetchone()[0]
+
+    def close(self) -> None:
+        self.db.close()
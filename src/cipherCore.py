@@ -0,0 +1,362 @@
+"""
+Reciprocal cipher engine shared by every front end (cipherSubmit.py, cipherGraphical.py, cipher.py and the notebook)
+
+Keys are either plain dicts cipher letter -> plain letter that always stay reciprocal (x -> y iff y -> x)
+or ReciprocalKey, the compact 26 byte form the solvers use, every function here takes both.
+KeyHistory keeps undo / redo and named checkpoints of the key edited in an interactive session.
+key_string / key_from_string turn them into the 26 letter text form (plain letter of A..Z in order)
+used for storage and results. Counting comes from the numpy backend in cipherVec, decoding is a single str.translate.
+Nothing here imports matplotlib or tkinter.
+
+"""
+from collections import deque
+from collections.abc import Mapping
+
+from cipherVec import ALPHABET, letter_freq, ngram_stats, top_trigrams, translate_table
+
+# global from : https://mathcenter.oxford.emory.edu/site/math125/englishLetterFreqs/
+COMMON_FREQ = "ETAOINSHRDLCUMWFGYPBVKJXQZ"
+COMMON_VALS = [
+    0.12702, 0.09056, 0.08167, 0.07507, 0.06966, 0.06749, 0.06327, 0.06094, 0.05987,
+    0.04253, 0.04025, 0.02782, 0.02758, 0.02406, 0.02360, 0.02228, 0.02015, 0.01974,
+    0.01929, 0.01492, 0.00978, 0.00772, 0.00153, 0.00150, 0.00095, 0.00074
+]
+
+__all__ = [
+    "ALPHABET", "COMMON_FREQ", "COMMON_VALS",
+    "letter_freq", "decode", "top_trigrams", "ngram_stats",
+    "make_identity_pairs", "is_reciprocal", "set_pair", "associate",
+    "initial_reciprocal_mapping_by_frequency", "mapping_by_frequency",
+    "key_string", "key_from_string", "ReciprocalKey", "KeyHistory", "translation_table",
+]
+
+#letter -> code, either case
+CODES = {c: i for i, c in enumerate(ALPHABET)}
+CODES.update({c.lower(): i for i, c in enumerate(ALPHABET)})
+
+
+def _code(letter) -> int:
+    try:
+        return CODES[letter]
+    except (KeyError, TypeError):
+        raise ValueError("Letters must be A-Z.") from None
+
+
+class ReciprocalKey(Mapping):
+    """
+    Reciprocal key stored as 26 bytes, byte i is the code of the partner of letter i (i itself when unpaired).
+
+    Every change goes through set_pair / associate which always write both directions, so a key can never stop
+    being an involution and checking it never needs a scan. It reads like a read only dict (key["A"], key.get,
+    items, dict(key)) so it drops into code written for mapping dicts, and keeps a cached str.translate table
+    for decode. Equal keys hash alike: do not change a key while it is in a set or used as a dict key.
+    """
+
+    __slots__ = ("_pairs", "_table", "_hash")
+
+    def __init__(self, pairs=None):
+        self._pairs = bytearray(range(26)) if pairs is None else bytearray(pairs)
+        if len(self._pairs) != 26 or any(p >= 26 or self._pairs[p] != i for i, p in enumerate(self._pairs)):
+            raise ValueError("Key is not reciprocal.")
+        self._table = None
+        self._hash = None
+
+    @classmethod
+    def from_mapping(cls, mapping) -> "ReciprocalKey":
+        if isinstance(mapping, ReciprocalKey):
+            return mapping.copy()
+        return cls(_code(mapping.get(c, c)) for c in ALPHABET)
+
+    def copy(self) -> "ReciprocalKey":
+        new = ReciprocalKey.__new__(ReciprocalKey)
+        new._pairs = self._pairs[:]
+        new._table = self._table
+        new._hash = self._hash
+        return new
+
+    @property
+    def pairs(self) -> bytes:
+        return bytes(self._pairs)
+
+    def code(self, i: int) -> int:
+        return self._pairs[i]
+
+    def _changed(self) -> None:
+        self._table = None
+        self._hash = None
+
+    def set_pair(self, a: str, b: str) -> tuple:
+        #pairs a with b, whatever a and b were paired with before is left mapping to itself
+        ia, ib = _code(a), _code(b)
+        p = self._pairs
+        touched = {ia, ib, p[ia], p[ib]}
+        old = {i: p[i] for i in touched}
+        p[p[ia]] = p[ia]
+        p[p[ib]] = p[ib]
+        p[ia] = ib
+        p[ib] = ia
+        return self._done(old)
+
+    def associate(self, a: str, b: str) -> tuple:
+        """associate() on the key in O(1), returns the codes of the letters whose partner changed."""
+        return self.associate_codes(_code(a), _code(b))
+
+    def associate_codes(self, ia: int, ib: int) -> tuple:
+        #in place on the bytearray, the changed codes come back as a tuple of at most 4 (no dicts or sets per move)
+        p = self._pairs
+        oa = p[ia]
+        if ia == ib or oa == ib:
+            return ()
+        ob = p[ib]
+        p[ia] = ib
+        p[ib] = ia
+        self._table = None
+        self._hash = None
+        #the old partners pair up, or go back to themselves when only one is left over
+        if oa == ia:
+            if ob == ib:
+                return ia, ib
+            p[ob] = ob
+            return ia, ib, ob
+        if ob == ib:
+            p[oa] = oa
+            return ia, ib, oa
+        p[oa] = ob
+        p[ob] = oa
+        return ia, ib, oa, ob
+
+    def _done(self, old: dict) -> tuple:
+        changed = tuple(i for i, v in old.items() if self._pairs[i] != v)
+        if changed:
+            self._changed()
+        return changed
+
+    def diff(self, other) -> tuple:
+        #((code, partner here, partner in other), ...) for every letter the two keys disagree on
+        other = ReciprocalKey.from_mapping(other) if not isinstance(other, ReciprocalKey) else other
+        return tuple((i, p, q) for i, (p, q) in enumerate(zip(self._pairs, other._pairs)) if p != q)
+
+    def apply(self, delta: tuple, undo: bool = False) -> tuple:
+        #replays a diff() record taken from this key's current state (or reverts it), returns the changed codes
+        for i, old, new in delta:
+            self._pairs[i] = old if undo else new
+        if delta:
+            self._changed()
+        return tuple(i for i, _, _ in delta)
+
+    def translation(self) -> dict:
+        #str.translate table, built once per key state
+        if self._table is None:
+            self._table = translation_table(self)
+        return self._table
+
+    def __getitem__(self, letter: str) -> str:
+        return ALPHABET[self._pairs[CODES[letter]]]
+
+    def __iter__(self):
+        return iter(ALPHABET)
+
+    def __len__(self) -> int:
+        return 26
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, ReciprocalKey):
+            return self._pairs == other._pairs
+        if isinstance(other, Mapping):
+            return all(other.get(c, c) == self[c] for c in ALPHABET)
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        if self._hash is None:
+            self._hash = hash(bytes(self._pairs))
+        return self._hash
+
+    def __repr__(self) -> str:
+        return f"ReciprocalKey({key_string(self)!r})"
+
+    def __getstate__(self):
+        return bytes(self._pairs)
+
+    def __setstate__(self, state):
+        self._pairs = bytearray(state)
+        self._table = None
+        self._hash = None
+
+
+def make_identity_pairs() -> dict:
+    #map each character to itself initially 
+    return {c: c for c in ALPHABET}
+
+def is_reciprocal(mapping: dict) -> bool:
+    #a ReciprocalKey cannot be anything else
+    if isinstance(mapping, ReciprocalKey):
+        return True
+    #sanity check for reciprocity of mapping 
+    for a in ALPHABET:
+        #b is the pair of a 
+        b = mapping.get(a, a)
+        if b not in ALPHABET:
+            return False
+        # check that a is the pair of b
+        if mapping.get(b, b) != a:
+            return False
+    return True
+
+def set_pair(mapping: dict, a: str, b: str) -> None:
+    if isinstance(mapping, ReciprocalKey):
+        mapping.set_pair(a, b)
+        return
+
+    a = a.upper()
+    b = b.upper()
+    
+    if a not in ALPHABET or b not in ALPHABET:
+        raise ValueError("Letters must be A-Z.")
+    #association of 2 letters reciprocally 
+    mapping[a] = b
+    mapping[b] = a
+
+def initial_reciprocal_mapping_by_frequency(ct: str) -> dict:
+    return mapping_by_frequency(letter_freq(ct))
+
+def mapping_by_frequency(freqs: dict) -> dict:
+    #same seed from precomputed frequencies, e.g. streamed from a file too big to load
+    # the original frequencies is indescending order so we sort this in reverse so they can be matched
+    ranked = sorted(freqs, key=freqs.get, reverse=True)
+
+    mapping = make_identity_pairs()
+    
+    #to avoid duplicate entries
+    used = set()
+
+    i = 0
+    j = 0
+    #map new pairs : most frequent in cipher to most frequent from common freq
+    while i < len(ranked) and j < len(COMMON_FREQ):
+        c = ranked[i]
+        p = COMMON_FREQ[j]
+        i += 1
+        j += 1
+
+        if c in used or p in used:
+            continue
+
+        set_pair(mapping, c, p)
+        used.add(c)
+        used.add(p)
+
+    return mapping
+
+def associate(mapping: dict, a: str, b: str) -> None:
+    #association in plce of swapping so any 2 letters a and b can be associated at runtime
+    if isinstance(mapping, ReciprocalKey):
+        mapping.associate(a, b)
+        return
+    a = a.upper()
+    b = b.upper()
+    if a not in ALPHABET or b not in ALPHABET:
+        raise ValueError("Letters must be A-Z.")
+    if a == b:
+        return
+
+    old_a_partner = mapping.get(a, a)
+    old_b_partner = mapping.get(b, b)
+
+
+    set_pair(mapping, a, b)
+
+    # remove the pairing of the old partners to the associated values
+    orphans = {old_a_partner, old_b_partner} - {a, b}
+
+
+    if len(orphans) == 2:
+        o1, o2 = orphans
+        set_pair(mapping, o1, o2)
+    #if one of the letters was mapped to itself 
+    elif len(orphans) == 1:
+
+        o1 = orphans.pop()
+        set_pair(mapping, o1, o1)
+
+def key_string(mapping: dict) -> str:
+    #plaintext letter of A..Z in order, the compact form used in results and caches
+    return "".join(mapping.get(c, c) for c in ALPHABET)
+
+def key_from_string(key: str) -> dict:
+    key = key.strip().upper()
+    if len(key) != 26:
+        raise ValueError("A key must be 26 letters.")
+    mapping = dict(zip(ALPHABET, key))
+    if not is_reciprocal(mapping):
+        raise ValueError("Key is not reciprocal.")
+    return mapping
+
+def translation_table(mapping) -> dict:
+    #str.translate table: letters of either case -> plain letter in upper case, everything else untouched
+    plain = key_string(mapping)
+    return str.maketrans(ALPHABET + ALPHABET.lower(), plain + plain)
+
+def decode(text, mapping) -> str:
+    #one C level translate, a ReciprocalKey reuses its cached table
+    table = mapping.translation() if isinstance(mapping, ReciprocalKey) else translation_table(mapping)
+    if isinstance(text, str):
+        return text.translate(table)
+    #bytes / memory mapped text
+    return bytes(text).translate(translate_table(mapping)).decode("utf-8", errors="replace")
+
+
+class KeyHistory:
+    """
+    Undo / redo and named checkpoints for the key of an interactive session.
+
+    A step is stored as the delta it made ((code, old partner, new partner) per changed letter) instead of a
+    copy of the key, an associate touches at most 4 letters so a step is a handful of small ints, and only the
+    last `limit` steps are kept so a long session never grows without bound. Checkpoints are 26 byte snapshots.
+    key is changed in place, so a reference to it always shows the current state.
+    Every change returns the codes of the letters whose partner moved (for DecodedView.sync and the like).
+    """
+
+    def __init__(self, mapping=None, limit: int = 1000):
+        self.key = ReciprocalKey() if mapping is None else ReciprocalKey.from_mapping(mapping)
+        self.undo_steps = deque(maxlen=limit)
+        self.redo_steps = []
+        self.checkpoints = {}
+
+    def _record(self, delta: tuple) -> tuple:
+        if delta:
+            self.undo_steps.append(delta)
+            self.redo_steps.clear()
+        return tuple(i for i, _, _ in delta)
+
+    def associate(self, a: str, b: str) -> tuple:
+        before = self.key.pairs
+        changed = self.key.associate(a, b)
+        return self._record(tuple((i, before[i], self.key.code(i)) for i in changed))
+
+    def replace(self, mapping) -> tuple:
+        #whole new key (frequency seed, solver result, reset ...) as one undoable step
+        delta = self.key.diff(mapping)
+        self.key.apply(delta)
+        return self._record(delta)
+
+    def undo(self) -> tuple:
+        if not self.undo_steps:
+            return ()
+        delta = self.undo_steps.pop()
+        self.redo_steps.append(delta)
+        return self.key.apply(delta, undo=True)
+
+    def redo(self) -> tuple:
+        if not self.redo_steps:
+            return ()
+        delta = self.redo_steps.pop()
+        self.undo_steps.append(delta)
+        return self.key.apply(delta)
+
+    def save(self, name: str) -> None:
+        self.checkpoints[name] = self.key.pairs
+
+    def restore(self, name: str) -> tuple:
+        #raises KeyError for an unknown name, restoring is itself undoable
+        return self.replace(ReciprocalKey(self.checkpoints[name]))
+
@@ -0,0 +1,194 @@
+"""
+Synthetic reciprocal cipher corpus and solver accuracy curves
+
+usage : python cipherCorpus.py generate [--lengths 50,100,200,400,800] [--per-length 20] [--noise 0.0] [--fixed 0] [-o corpus.jsonl]
+        python cipherCorpus.py evaluate corpus.jsonl [--workers N] [--reliable 0.9]
+
+generate encrypts random word sequences from words_alpha.txt with random involutive keys and writes one JSON line
+per message: id, ciphertext, key (26 letter form), plaintext (what was encrypted, noise included), length, noise, fixed.
+--fixed keeps that many letters mapped to themselves (like the identity pairs associate can leave behind), --noise
+replaces that fraction of the letters with random ones before encrypting (typos, garbled transmission).
+The files are valid cipherBatch.py input.
+
+evaluate cracks a corpus through the batch path (cipherBatch.run_batch) and prints per length the solve rate
+(every letter of the message decodes right), median key accuracy and median time, then the shortest length
+from which every longer one is solved at least --reliable of the time.
+
+"""
+import argparse
+import io
+import json
+import random
+import statistics
+import sys
+import time
+from functools import lru_cache
+
+from cipherCore import ALPHABET, ReciprocalKey, decode, key_from_string, key_string
+
+DEFAULT_LENGTHS = "50,100,200,400,800"
+#text blocks bigger than this are repeated instead of generated word by word
+BLOCK_CHARS = 1 << 20
+
+
+def random_involution(rng: random.Random, fixed: int = 0) -> ReciprocalKey:
+    #`fixed` letters keep mapping to themselves, the other 26 - fixed are paired up at random
+    if not 0 <= fixed <= 26 or fixed % 2:
+        raise ValueError("fixed must be an even number of letters from 0 to 26.")
+    letters = list(ALPHABET)
+    rng.shuffle(letters)
+    paired = letters[fixed:]
+    key = ReciprocalKey()
+    for a, b in zip(paired[::2], paired[1::2]):
+        key.set_pair(a, b)
+    return key
+
+
+@lru_cache(maxsize=1)
+def sorted_words() -> tuple:
+    #word list in a fixed order so a seeded rng picks the same words every run, sorted once per process
+    from cipherWords import word_set
+    return tuple(sorted(word_set()))
+
+
+def plain_text(n: int, rng: random.Random) -> str:
+    #n characters of random dictionary words separated by spaces, in upper case like the front ends use
+    words = sorted_words()
+    out, length = [], 0
+    while length < min(n, BLOCK_CHARS):
+        w = rng.choice(words)
+        out.append(w)
+        length += len(w) + 1
+    block = " ".join(out)[:BLOCK_CHARS]
+    return (block * (n // len(block) + 1))[:n].rstrip()
+
+
+def add_noise(text: str, noise: float, rng: random.Random) -> str:
+    #every letter is replaced by a random one with probability noise
+    if noise <= 0:
+        return text
+    return "".join(rng.choice(ALPHABET) if ch in ALPHABET and rng.random() < noise else ch for ch in text)
+
+
+def make_record(cid: str, length: int, rng: random.Random, noise: float = 0.0, fixed: int = 0) -> dict:
+    key = random_involution(rng, fixed)
+    plain = add_noise(plain_text(length, rng), noise, rng)
+    return {
+        "id": cid,
+        "ciphertext": decode(plain, key),
+        "key": key_string(key),
+        "plaintext": plain,
+        "length": length,
+        "noise": noise,
+        "fixed": fixed,
+    }
+
+
+def generate(lengths, per_length: int, noise: float = 0.0, fixed: int = 0, seed=None):
+    """Yields per_length records for every length, shortest first."""
+    rng = random.Random(seed)
+    for length in lengths:
+        for i in range(per_length):
+            yield make_record(f"len{length}-{i}", length, rng, noise, fixed)
+
+
+def key_accuracy(ct: str, true_key: dict, found_key: dict) -> float:
+    #share of the distinct cipher letters of ct whose partner was recovered
+    letters = {ch for ch in ct.upper() if ch in ALPHABET}
+    if not letters:
+        return 1.0
+    return sum(found_key[c] == true_key[c] for c in letters) / len(letters)
+
+
+def evaluate(records: list, workers: int = None) -> list:
+    """Cracks every record, returns one row per record: (length, solved, key accuracy, seconds)."""
+    from cipherBatch import run_batch
+    out = io.StringIO()
+    run_batch(((r["id"], r["ciphertext"]) for r in records), out, workers)
+    found = {}
+    for line in out.getvalue().splitlines():
+        result = json.loads(line)
+        found[result["id"]] = result
+
+    rows = []
+    for r in records:
+        result = found[r["id"]]
+        true_key = key_from_string(r["key"])
+        solved = decode(r["ciphertext"], true_key) == result["plaintext"]
+        rows.append((r["length"], solved, key_accuracy(r["ciphertext"], true_key, key_from_string(result["key"])),
+                     result["elapsed"]))
+    return rows
+
+
+def summarize(rows: list, reliable: float = 0.9) -> tuple:
+    """[(length, count, solve rate, median accuracy, median seconds)] by length, and the shortest reliable length."""
+    by_length = {}
+    for length, solved, accuracy, seconds in rows:
+        by_length.setdefault(length, []).append((solved, accuracy, seconds))
+    table = []
+    for length in sorted(by_length):
+        runs = by_length[length]
+        table.append((length, len(runs), sum(s for s, _, _ in runs) / len(runs),
+                      statistics.median(a for _, a, _ in runs), statistics.median(t for _, _, t in runs)))
+    #shortest length from which every longer one also clears the bar
+    shortest = None
+    for length, _, rate, _, _ in reversed(table):
+        if rate < reliable:
+            break
+        shortest = length
+    return table, shortest
+
+
+def read_corpus(path: str) -> list:
+    f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        return [json.loads(line) for line in f if line.strip()]
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic reciprocal ciphertexts and measure the solver on them.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    gen = sub.add_parser("generate", help="write a corpus as JSONL")
+    gen.add_argument("--lengths", default=DEFAULT_LENGTHS, help=f"message lengths in characters (default {DEFAULT_LENGTHS})")
+    gen.add_argument("--per-length", type=int, default=20, help="messages per length")
+    gen.add_argument("--noise", type=float, default=0.0, help="fraction of plaintext letters replaced at random")
+    gen.add_argument("--fixed", type=int, default=0, help="letters the key maps to themselves (even, 0-26)")
+    gen.add_argument("--seed", type=int, default=None, help="seed for a reproducible corpus")
+    gen.add_argument("-o", "--out", help="corpus file, stdout when omitted")
+
+    ev = sub.add_parser("evaluate", help="crack a corpus and report solve rate / time against length")
+    ev.add_argument("corpus", help="corpus JSONL file written by generate (- for stdin)")
+    ev.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    ev.add_argument("--reliable", type=float, default=0.9, help="solve rate a length needs to count as reliable")
+    args = parser.parse_args()
+
+    if args.cmd == "generate":
+        lengths = [int(n) for n in args.lengths.split(",")]
+        out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+        try:
+            for record in generate(lengths, args.per_length, args.noise, args.fixed, args.seed):
+                out.write(json.dumps(record) + "\n")
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        return
+
+    records = read_corpus(args.corpus)
+    start = time.perf_counter()
+    table, shortest = summarize(evaluate(records, args.workers), args.reliable)
+    print(f"{'length':>8}{'n':>6}{'solved':>9}{'key acc':>9}{'median s':>10}")
+    for length, n, rate, accuracy, seconds in table:
+        print(f"{length:>8}{n:>6}{rate:>9.0%}{accuracy:>9.0%}{seconds:>10.2f}")
+    if shortest is None:
+        print(f"\nNo length is solved {args.reliable:.0%} of the time.")
+    else:
+        print(f"\nReliable ({args.reliable:.0%} solved) from {shortest} characters on.")
+    print(f"{len(records)} messages in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Exact branch and bound solver for short reciprocal ciphertexts
+
+A reciprocal key is a partial matching of the 26 letters, so the search only has to decide one partner per
+cipher letter: letters of the ciphertext are taken most frequent first (letter_freq) and paired with every
+letter still free, or with themselves. Letters that never occur are left mapping to themselves unless picked.
+
+Every node carries an upper bound on the n-gram score (cipherSolver fitness) of any key completing it: each
+scored window counts the best table entry that agrees with its letters decoded so far, the undecided positions
+left free. Those wildcard maxima come from the bound table (the n-gram table maximised over every subset of
+positions, built once and memoized) so a bound is one gather per window, and a new pairing only rescores the
+windows holding its two letters. Children are tried best bound first and cut once their bound cannot beat the
+best key so far. The search starts from the deterministic steepest solve, when it runs to the end inside its
+budget (which the starting solves share) the key it returns is provably the best under the model ("proven").
+
+The word pattern domains of cipherWords (propagate) decide which partner is tried first among equal bounds,
+with words=True they also prune: still exact, but only over keys that agree with the dictionary words.
+
+"""
+import time
+from functools import lru_cache
+
+import numpy as np
+
+from cipherCore import ALPHABET, letter_freq
+from cipherModel import OFFSETS, ORDERS, TABLE_SIZE, load_flat_model
+from cipherSolver import EncodedCipher, ORDER, key_array, solve
+from cipherWords import propagate, tokens, word_candidates
+
+#partner code of a letter not decided yet
+FREE = -1
+#how many nodes run between two looks at the clock / stop flag
+CHECK_EVERY = 64
+EPS = 1e-9
+
+
+@lru_cache(maxsize=1)
+def bound_table() -> np.ndarray:
+    """
+    (16, TABLE_SIZE) float32: row m is the flat n-gram table where every position whose bit is set in m
+    (bit j = column j of a left padded ORDER wide window) is replaced by the best letter for it.
+    """
+    table = load_flat_model()
+    bounds = np.empty((1 << ORDER, TABLE_SIZE), dtype=np.float32)
+    for k in ORDERS:
+        section = table[OFFSETS[k]:OFFSETS[k] + 26 ** k].reshape((26,) * k)
+        pad = ORDER - k
+        for mask in range(1 << ORDER):
+            #the pad columns of a short window are never free, those rows are left as plain copies
+            axes = tuple(j - pad for j in range(pad, ORDER) if mask >> j & 1)
+            best = section.max(axis=axes, keepdims=True) if axes else section
+            bounds[mask, OFFSETS[k]:OFFSETS[k] + 26 ** k] = np.broadcast_to(best, section.shape).ravel()
+    return bounds
+
+
+def word_domains(ct: str, deadline: float = None) -> dict:
+    #cipher letter -> plain letters the dictionary words allow for it, letters no word pins down are left out
+    counts = {}
+    for w in tokens(ct):
+        counts[w] = counts.get(w, 0) + 1
+    domains = {}
+    words = list(counts)
+    for w, cs in propagate(words, word_candidates(words, deadline), deadline).items():
+        for i, c in enumerate(w):
+            allowed = {p[i] for p in cs}
+            domains[c] = domains[c] & allowed if c in domains else allowed
+    return domains
+
+
+def solve_exact(ct: str, time_limit: float = 10.0, words: bool = False, stop=None, start: dict = None,
+                stats: dict = None) -> tuple:
+    """
+    Branch and bound over reciprocal keys, returns (mapping, score, proven). proven is False when the
+    time budget (or stop()) ended the search first, mapping is then the best key found so far.
+    start is the incumbent to beat (default: the better of the steepest and a seeded annealing solve),
+    stats (a dict) gets the number of search nodes.
+    """
+    stats = {} if stats is None else stats
+    #the budget covers everything below, the incumbent solves and the word domains included
+    deadline = time.monotonic() + time_limit
+
+    def out_of_time() -> bool:
+        return time.monotonic() > deadline or (stop is not None and stop())
+
+    ct = ct.upper()
+    cipher = EncodedCipher(ct)
+    bounds = bound_table()
+    grams, offsets, weights, member = cipher.grams, cipher.offsets, cipher.weights, cipher.member
+    bits = 1 << np.arange(ORDER)
+
+    #the better the first incumbent the more gets cut, the two stochastic-free starts are cheap next to the search
+    if start is not None:
+        starts = [start]
+    else:
+        starts = [solve(ct, method="steepest", stop=out_of_time)[0], solve(ct, seed=0, stop=out_of_time)[0]]
+    keys = key_array(starts)
+    scores = cipher.score_keys(keys)
+    best = {"key": keys[int(np.argmax(scores))].astype(np.int64), "score": float(scores.max())}
+
+    freq = letter_freq(ct)
+    order = [i for i in sorted(range(26), key=lambda i: -freq[ALPHABET[i]]) if member[i].any()]
+    domains = {ALPHABET.index(c): {ALPHABET.index(p) for p in ps} for c, ps in word_domains(ct, deadline).items()}
+
+    #partner code of every letter, index 26 is the padding code which always reads as digit 0
+    part = np.full(27, FREE, dtype=np.int64)
+    part[26] = 0
+
+    def window_bounds(vals: np.ndarray, wins: np.ndarray) -> np.ndarray:
+        #partner codes of the letters of windows wins ((N, ORDER), FREE if open) -> bound of every one of them
+        free = vals == FREE
+        idx = np.where(free, 0, vals) @ cipher.powers + offsets[wins]
+        return bounds[free @ bits, idx].astype(np.float64)
+
+    contrib = window_bounds(part[grams], np.arange(len(weights)))
+    nodes = 0
+    aborted = False
+
+    def search(bound: float, depth: int) -> None:
+        nonlocal nodes, aborted
+        nodes += 1
+        if nodes % CHECK_EVERY == 0 and out_of_time():
+            aborted = True
+            return
+        while depth < len(order) and part[order[depth]] != FREE:
+            depth += 1
+        if depth == len(order):
+            #every letter of the text is decided, the bound is the score itself
+            if bound > best["score"] + EPS:
+                key = part[:26].copy()
+                unused = key == FREE
+                key[unused] = np.flatnonzero(unused)
+                best["key"] = key
+                best["score"] = float(cipher.score_keys(key[None].astype(np.uint8))[0])
+            return
+
+        c = order[depth]
+        allowed = domains.get(c)
+        partners = np.flatnonzero(part[:26] == FREE)
+        if words and allowed is not None:
+            partners = np.array([p for p in partners if p in allowed], dtype=np.int64)
+        if not len(partners):
+            return
+        rows = np.arange(len(partners))
+        #only the windows holding c or p change under child p, as (child, window) pairs in child order
+        owner, wins = np.nonzero(member[partners] | member[c])
+        letters = grams[wins]
+        mates = partners[owner][:, None]
+        new = window_bounds(np.where(letters == c, mates, np.where(letters == mates, c, part[letters])), wins)
+        gain = (new - contrib[wins]) * weights[wins]
+        children = bound + np.bincount(owner, weights=gain, minlength=len(partners))
+        ends = np.searchsorted(owner, np.arange(len(partners) + 1))
+        preferred = [allowed is None or p in allowed for p in partners]
+        ranked = sorted(rows, key=lambda r: (-children[r], not preferred[r], partners[r]))
+
+        saved = contrib.copy()
+        for r in ranked:
+            if children[r] <= best["score"] + EPS or aborted:
+                break
+            p = partners[r]
+            part[c] = p
+            part[p] = c
+            contrib[wins[ends[r]:ends[r + 1]]] = new[ends[r]:ends[r + 1]]
+            search(float(children[r]), depth + 1)
+            contrib[:] = saved
+            part[c] = FREE
+            part[p] = FREE
+
+    search(float(contrib @ weights), 0)
+    stats["nodes"] = nodes
+    mapping = {ALPHABET[i]: ALPHABET[int(best["key"][i])] for i in range(26)}
+    return mapping, best["score"], not aborted
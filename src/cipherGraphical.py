@@ -1,130 +1,111 @@
+import queue
+import threading
+import time
 import tkinter as tk
 from tkinter import ttk, messagebox
-from collections import Counter
-from operator import itemgetter
 
 import matplotlib.pyplot as plt
+import numpy as np
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
-COMMON_FREQ = "ETAOINSHRDLCUMWFGYPBVKJXQZ"
-COMMON_VALS = [
-    0.12702, 0.09056, 0.08167, 0.07507, 0.06966, 0.06749, 0.06327, 0.06094, 0.05987,
-    0.04253, 0.04025, 0.02782, 0.02758, 0.02406, 0.02360, 0.02228, 0.02015, 0.01974,
-    0.01929, 0.01492, 0.00978, 0.00772, 0.00153, 0.00150, 0.00095, 0.00074
-]
-ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
-
-
-def letter_freq(text: str) -> dict[str, float]:
-    letters = [ch for ch in text.upper() if ch.isalpha()]
-    total = len(letters)
-    freqs = {c: 0.0 for c in ALPHABET}
-    if total == 0:
-        return freqs
-    counts = Counter(letters)
-    for c in ALPHABET:
-        freqs[c] = counts.get(c, 0) / total
-    return freqs
-
-
-def make_identity_pairs() -> dict[str, str]:
-    return {c: c for c in ALPHABET}
-
-
-def is_reciprocal(mapping: dict[str, str]) -> bool:
-    for a in ALPHABET:
-        b = mapping.get(a, a)
-        if b not in ALPHABET:
-            return False
-        if mapping.get(b, b) != a:
-            return False
-    return True
-
-
-def set_pair(mapping: dict[str, str], a: str, b: str) -> None:
-    a = a.upper()
-    b = b.upper()
-    if a not in ALPHABET or b not in ALPHABET:
-        raise ValueError("Letters must be A-Z.")
-    mapping[a] = b
-    mapping[b] = a
-
-
-def initial_reciprocal_mapping_by_frequency(ciphertext: str) -> dict[str, str]:
-    freqs = letter_freq(ciphertext)
-    ranked = [c for c, _ in sorted(freqs.items(), key=itemgetter(1), reverse=True)]
-
-    mapping = make_identity_pairs()
-    used = set()
-
-    i = 0
-    j = 0
-    while i < len(ranked) and j < len(COMMON_FREQ):
-        c = ranked[i]
-        p = COMMON_FREQ[j]
-        i += 1
-        j += 1
-
-        if c in used or p in used:
-            continue
-
-        set_pair(mapping, c, p)
-        used.add(c)
-        used.add(p)
-
-    return mapping
-
-
-def decode(text: str, mapping: dict[str, str]) -> str:
-    out = []
-    for ch in text:
-        if ch.isalpha():
-            up = ch.upper()
-            out.append(mapping.get(up, up))
-        else:
-            out.append(ch)
-    return "".join(out)
-
-
-def associate(mapping: dict[str, str], a: str, b: str) -> None:
-    a = a.upper()
-    b = b.upper()
-    if a not in ALPHABET or b not in ALPHABET:
-        raise ValueError("Letters must be A-Z.")
-    if a == b:
-        return
-
-
-    c1 = mapping.get(a, a)
-    
-
-    x = c1
-    y = b
-  
-    xp = mapping.get(x, x) 
-    yp = mapping.get(y, y)
-    
-  
-    orphans = {xp, yp} - {x, y}
-    
-  
-    set_pair(mapping, x, y)
-    
- 
-    if len(orphans) == 2:
-        o1, o2 = orphans
-        set_pair(mapping, o1, o2)
-    elif len(orphans) == 1:
-        o1 = orphans.pop()
-        set_pair(mapping, o1, o1)
-
-
-def top_trigrams(text: str, n: int = 10) -> list[tuple[str, int]]:
-    letters = [ch for ch in text.upper() if ch.isalpha()]
-    if len(letters) < 3:
-        return []
-    trigs = (letters[i] + letters[i + 1] + letters[i + 2] for i in range(len(letters) - 2))
-    return Counter(trigs).most_common(n)
+from cipherCore import (
+    ALPHABET,
+    COMMON_FREQ,
+    COMMON_VALS,
+    KeyHistory,
+    initial_reciprocal_mapping_by_frequency,
+    is_reciprocal,
+    key_string,
+    letter_freq,
+    make_identity_pairs,
+    ngram_stats,
+)
+from cipherProfile import profile_thread, report, setup, timed
+from cipherVec import DecodedView, key_table
+
+#changed letters closer than this many characters are rewritten as one range of the output box
+PATCH_GAP = 32
+#past this many ranges a single full replace is cheaper than patching
+MAX_PATCHES = 2000
+#how often the Tk loop picks up messages from the worker thread (ms), and how often a job may report progress (s)
+POLL_MS = 50
+PROGRESS_EVERY = 0.2
+
+
+class BackgroundWorker:
+    """
+    One daemon thread that runs the heavy jobs of the GUI off the Tk main loop, in the order they were submitted.
+
+    A job is fn(report, cancelled, *args): report(value) streams progress, cancelled() tells it to wrap up.
+    Everything it produces comes back as ("progress" | "done" | "error" | "cancelled", job id, value) on
+    `messages`, which the GUI drains from an after() callback, so widgets are only ever touched by the Tk thread.
+    """
+
+    def __init__(self):
+        self.tasks = queue.Queue()
+        self.messages = queue.Queue()
+        self.flags = {}
+        self.next_id = 0
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, fn, *args) -> int:
+        self.next_id += 1
+        self.flags[self.next_id] = threading.Event()
+        self.tasks.put((self.next_id, fn, args))
+        return self.next_id
+
+    def cancel(self, job_id: int) -> None:
+        flag = self.flags.get(job_id)
+        if flag is not None:
+            flag.set()
+
+    def _run(self):
+        profile_thread()
+        while True:
+            job_id, fn, args = self.tasks.get()
+            flag = self.flags[job_id]
+            try:
+                if flag.is_set():
+                    self.messages.put(("cancelled", job_id, None))
+                    continue
+                result = fn(lambda value: self.messages.put(("progress", job_id, value)), flag.is_set, *args)
+                self.messages.put(("cancelled" if flag.is_set() else "done", job_id, result))
+            except Exception as e:
+                self.messages.put(("error", job_id, e))
+            finally:
+                self.flags.pop(job_id, None)
+
+
+def analyse_job(report, cancelled, ct: str, mapping) -> tuple:
+    #everything about a ciphertext that no key change can alter, plus its full decryption
+    view = DecodedView(ct, mapping)
+    view.text()
+    line_starts = np.r_[0, np.array([i + 1 for i, ch in enumerate(ct) if ch == "\n"], dtype=np.int64)]
+    #decoding relabels letters one to one, so the cipher trigrams are counted once and permuted through each key
+    stats = ngram_stats(ct)
+    stats.ranked(3)
+    freqs = letter_freq(ct) if ct.strip() else None
+    return ct, view, line_starts, stats, freqs
+
+
+def seed_job(report, cancelled, ct: str) -> tuple:
+    #results carry their ciphertext, another one may have been loaded by the time they arrive
+    return ct, initial_reciprocal_mapping_by_frequency(ct.upper())
+
+
+def solve_job(report, cancelled, ct: str) -> tuple:
+    #imported on first use, the GUI starts without the solver and its model
+    from cipherSolver import solve
+    start = time.perf_counter()
+    last = [0.0]
+
+    def progress(best, score, moves):
+        now = time.perf_counter()
+        if now - last[0] >= PROGRESS_EVERY:
+            last[0] = now
+            report((ct, key_string(best), score, moves / max(now - start, 1e-9)))
+
+    return (ct,) + solve(ct, stop=cancelled, progress=progress)
 
 
 class ReciprocalCrackerGUI(tk.Tk):
@@ -134,10 +115,22 @@ class ReciprocalCrackerGUI(tk.Tk):
         self.geometry("1200x800")
 
         self.ct = ""
-        self.mapping = make_identity_pairs()
+        #history changes the key in place, self.mapping is always the current one
+        self.history = KeyHistory(make_identity_pairs())
+        self.mapping = self.history.key
+        #per ciphertext state, rebuilt by a full refresh
+        self.view = None
+        self.line_starts = np.zeros(1, dtype=np.int64)
+        self.stats = None
+
+        #job id -> (on_done, on_progress) for jobs still running on the worker thread
+        self.worker = BackgroundWorker()
+        self.jobs = {}
+        self.solve_job = None
 
         self._build_ui()
         self._build_plot()
+        self.after(POLL_MS, self._poll_worker)
 
     def _build_ui(self):
         top = ttk.Frame(self, padding=10)
@@ -195,6 +188,19 @@ class ReciprocalCrackerGUI(tk.Tk):
         ttk.Button(btns, text="Update View", command=self.refresh_all).pack(fill=tk.X, pady=3)
         ttk.Button(btns, text="Check Reciprocal", command=self.check_reciprocal).pack(fill=tk.X, pady=3)
 
+        solve_frame = ttk.LabelFrame(right, text="Automatic Solve", padding=10)
+        solve_frame.pack(fill=tk.X, pady=5)
+
+        self.solve_btn = ttk.Button(solve_frame, text="Solve", command=self.start_solve)
+        self.solve_btn.pack(fill=tk.X, pady=3)
+        self.cancel_btn = ttk.Button(solve_frame, text="Cancel", command=self.cancel_solve, state="disabled")
+        self.cancel_btn.pack(fill=tk.X, pady=3)
+        self.busy = ttk.Progressbar(solve_frame, mode="indeterminate")
+        self.busy.pack(fill=tk.X, pady=3)
+
+        self.status_var = tk.StringVar(value="Ready.")
+        ttk.Label(self, textvariable=self.status_var, anchor="w", padding=(10, 0)).pack(side=tk.BOTTOM, fill=tk.X)
+
     def _build_plot(self):
         plot_frame = ttk.LabelFrame(self, text="Letter Frequencies", padding=10)
         plot_frame.pack(side=tk.BOTTOM, fill=tk.BOTH)
@@ -202,14 +208,66 @@ class ReciprocalCrackerGUI(tk.Tk):
         self.fig = plt.Figure(figsize=(10, 2.6), dpi=100)
         self.ax = self.fig.add_subplot(111)
 
+        #bars are drawn once here, later updates only change their heights
+        letters = list(ALPHABET)
+        x = list(range(len(letters)))
+        w = 0.42
+        self.ct_bars = self.ax.bar([i - w/2 for i in x], [0] * 26, width=w, edgecolor="black", label="Cipher")
+        self.en_bars = self.ax.bar([i + w/2 for i in x], [0] * 26, width=w, edgecolor="black", label="English")
+        self.ax.set_xticks(x)
+        self.ax.set_xticklabels(letters)
+        self.ax.set_title("Letter Frequencies: Ciphertext vs English")
+        self.ax.set_xlabel("Letter")
+        self.ax.set_ylabel("Frequency")
+        self.ax.legend()
+        self.fig.tight_layout()
+
         self.canvas = FigureCanvasTkAgg(self.fig, master=plot_frame)
         self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
 
+    def _submit(self, fn, *args, on_done=None, on_progress=None) -> int:
+        job_id = self.worker.submit(fn, *args)
+        self.jobs[job_id] = (on_done, on_progress)
+        self._set_busy(True)
+        return job_id
+
+    def _set_busy(self, busy: bool):
+        if busy:
+            self.busy.start(10)
+        else:
+            self.busy.stop()
+
+    def _poll_worker(self):
+        #runs on the Tk thread: hands every finished job / progress report to its callback
+        try:
+            while True:
+                kind, job_id, value = self.worker.messages.get_nowait()
+                on_done, on_progress = self.jobs.get(job_id, (None, None))
+                if kind == "progress":
+                    if on_progress is not None:
+                        on_progress(value)
+                    continue
+                self.jobs.pop(job_id, None)
+                if not self.jobs:
+                    self._set_busy(False)
+                if kind == "error":
+                    messagebox.showerror("Error", str(value))
+                    self.status_var.set("Failed.")
+                if on_done is not None:
+                    on_done(kind, value)
+        except queue.Empty:
+            pass
+        finally:
+            #a callback that raised must not stop the GUI from hearing about later jobs
+            self.after(POLL_MS, self._poll_worker)
+
     def load_cipher(self):
         self.ct = self.ct_entry.get().rstrip("\n")
         if not self.ct.strip():
             messagebox.showwarning("Empty", "Please enter ciphertext.")
             return
+        #a solve of the previous text would hold the worker and its key no longer applies
+        self.cancel_solve()
         self.refresh_all()
 
     def seed_mapping(self):
@@ -217,12 +275,54 @@ class ReciprocalCrackerGUI(tk.Tk):
             self.load_cipher()
             if not self.ct.strip():
                 return
-        self.mapping = initial_reciprocal_mapping_by_frequency(self.ct.upper())
-        self.refresh_all()
+        self.status_var.set("Seeding by frequency...")
+        self._submit(seed_job, self.ct, on_done=self._seed_done)
+
+    def _seed_done(self, kind, result):
+        if kind == "done" and result[0] == self.ct:
+            self.refresh_all(self.history.replace(result[1]))
+            self.status_var.set("Seeded by frequency.")
+
+    def start_solve(self):
+        if not self.ct.strip():
+            messagebox.showwarning("Empty", "Please load a ciphertext first.")
+            return
+        self.solve_btn.configure(state="disabled")
+        self.cancel_btn.configure(state="normal")
+        self.status_var.set("Solving...")
+        self.solve_job = self._submit(solve_job, self.ct, on_done=self._solve_done, on_progress=self._solve_progress)
+
+    def cancel_solve(self):
+        if self.solve_job is not None:
+            self.worker.cancel(self.solve_job)
+            self.status_var.set("Cancelling...")
+
+    def _solve_progress(self, value):
+        ct, key, score, rate = value
+        if ct != self.ct:
+            return
+        self.status_var.set(f"Solving... best score {score:.2f}   {rate:,.0f} moves/s   key {key}")
+
+    def _solve_done(self, kind, result):
+        self.solve_job = None
+        self.solve_btn.configure(state="normal")
+        self.cancel_btn.configure(state="disabled")
+        if kind == "error":
+            #_poll_worker has shown the exception, the key is left as it was
+            self.status_var.set(f"Solve failed ({result}), mapping unchanged.")
+            return
+        if result is not None and result[0] != self.ct:
+            #solve of a text that has been replaced since, its analysis owns the status line
+            return
+        if kind == "done":
+            _, mapping, score = result
+            self.refresh_all(self.history.replace(mapping))
+            self.status_var.set(f"Solved, score {score:.2f}.")
+        elif kind == "cancelled":
+            self.status_var.set("Solve cancelled, mapping unchanged.")
 
     def reset_mapping(self):
-        self.mapping = make_identity_pairs()
-        self.refresh_all()
+        self.refresh_all(self.history.replace(make_identity_pairs()))
 
     def do_associate(self):
         a = (self.a_var.get() or "").strip().upper()
@@ -231,67 +331,104 @@ class ReciprocalCrackerGUI(tk.Tk):
             messagebox.showwarning("Input", "Choose two letters.")
             return
         try:
-            associate(self.mapping, a, b)
+            changed = self.history.associate(a, b)
         except ValueError as e:
             messagebox.showerror("Error", str(e))
             return
-        self.refresh_all()
+        self.refresh_all(changed)
+
+    def refresh_all(self, changed=None):
+        #changed = letter codes whose partner moved, only what they touch is redrawn
+        #None redraws everything (new ciphertext or Update View)
+        if changed is None:
+            #the text is analysed and decoded on the worker thread, _analysis_done draws it
+            self.view = None
+            self.stats = None
+            self.status_var.set("Analysing ciphertext...")
+            self._submit(analyse_job, self.ct, self.mapping.copy(), on_done=self._analysis_done)
+        elif not changed:
+            return
+        elif self.view is not None:
+            self.view.sync(self.mapping, changed)
+            self._patch_output(changed)
+        self._update_trigrams()
+        self._update_mapping_list(changed)
 
-    def refresh_all(self):
+    def _analysis_done(self, kind, result):
+        #a newer ciphertext may have been loaded meanwhile, its own analysis is still queued
+        if kind != "done" or result[0] != self.ct:
+            return
+        _, self.view, self.line_starts, self.stats, freqs = result
+        #the key may have moved while the worker was busy
+        self.view.sync(self.mapping)
         self._update_output()
         self._update_trigrams()
-        self._update_mapping_list()
-        self._update_plot()
+        self._update_plot(freqs)
+        self.status_var.set("Ready.")
+
+    def _index(self, offset: int) -> str:
+        #character offset in the decoded text -> Text widget "line.column" index
+        line = int(np.searchsorted(self.line_starts, offset, side="right")) - 1
+        return f"{line + 1}.{offset - self.line_starts[line]}"
 
     def _update_output(self):
         self.out_text.delete("1.0", tk.END)
         if not self.ct:
             return
-        self.out_text.insert(tk.END, decode(self.ct, self.mapping))
+        self.out_text.insert(tk.END, self.view.text())
+
+    def _patch_output(self, changed):
+        #rewrites only the character ranges holding a changed cipher letter, nearby ones merged into one range
+        offsets = self.view.char_offsets(changed)
+        if len(offsets) == 0:
+            return
+        split = np.flatnonzero(np.diff(offsets) > PATCH_GAP)
+        if len(split) >= MAX_PATCHES:
+            self._update_output()
+            return
+        plain = self.view.text()
+        starts = np.r_[offsets[0], offsets[split + 1]]
+        ends = np.r_[offsets[split], offsets[-1]] + 1
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            self.out_text.replace(self._index(start), self._index(end), plain[start:end])
 
     def _update_trigrams(self):
         self.tri_text.delete("1.0", tk.END)
-        if not self.ct:
+        if not self.ct or self.stats is None:
             return
-        plain = decode(self.ct, self.mapping)
-        trigs = top_trigrams(plain, n=12)
+        trigs = self.stats.top(3, 12, table=key_table(self.mapping))
         if not trigs:
             self.tri_text.insert(tk.END, "No trigrams (need at least 3 letters).")
             return
         for i, (tri, k) in enumerate(trigs, start=1):
             self.tri_text.insert(tk.END, f"{i:2d}) {tri} -> {k}\n")
 
-    def _update_mapping_list(self):
-        self.map_list.delete(0, tk.END)
-        for c in ALPHABET:
-            self.map_list.insert(tk.END, f"{c} -> {self.mapping.get(c, c)}")
-
-    def _update_plot(self):
-        self.ax.clear()
-        if not self.ct.strip():
-            self.canvas.draw()
+    def _update_mapping_list(self, changed=None):
+        #only the rows of the letters that changed, all 26 when changed is None
+        if changed is None:
+            self.map_list.delete(0, tk.END)
+            for c in ALPHABET:
+                self.map_list.insert(tk.END, f"{c} -> {self.mapping.get(c, c)}")
             return
+        for i in changed:
+            self.map_list.delete(i)
+            self.map_list.insert(i, f"{ALPHABET[i]} -> {self.mapping.get(ALPHABET[i])}")
+
+    def _update_plot(self, ct_freq=None):
+        #only runs for a new ciphertext (a key change never moves the ciphertext frequencies), None clears it
+        if ct_freq is None:
+            ct_vals = en_vals = [0] * 26
+        else:
+            english_by_letter = {ch: val for ch, val in zip(COMMON_FREQ, COMMON_VALS)}
+            ct_vals = [ct_freq[c] for c in ALPHABET]
+            en_vals = [english_by_letter[c] for c in ALPHABET]
 
-        ct_freq = letter_freq(self.ct.upper())
-        english_by_letter = {ch: val for ch, val in zip(COMMON_FREQ, COMMON_VALS)}
-
-        letters = list(ALPHABET)
-        ct_vals = [ct_freq[c] for c in letters]
-        en_vals = [english_by_letter[c] for c in letters]
-
-        x = list(range(len(letters)))
-        w = 0.42
-
-        self.ax.bar([i - w/2 for i in x], ct_vals, width=w, edgecolor="black", label="Cipher")
-        self.ax.bar([i + w/2 for i in x], en_vals, width=w, edgecolor="black", label="English")
-        self.ax.set_xticks(x)
-        self.ax.set_xticklabels(letters)
-        self.ax.set_title("Letter Frequencies: Ciphertext vs English")
-        self.ax.set_xlabel("Letter")
-        self.ax.set_ylabel("Frequency")
-        self.ax.legend()
-        self.fig.tight_layout()
-        self.canvas.draw()
+        for bar, v in zip(self.ct_bars, ct_vals):
+            bar.set_height(v)
+        for bar, v in zip(self.en_bars, en_vals):
+            bar.set_height(v)
+        self.ax.set_ylim(0, max(max(ct_vals), max(en_vals)) * 1.1 or 1)
+        self.canvas.draw_idle()
 
     def check_reciprocal(self):
         ok = is_reciprocal(self.mapping)
@@ -299,5 +436,13 @@ class ReciprocalCrackerGUI(tk.Tk):
 
 
 if __name__ == "__main__":
+    #--profile [PREFIX] or CIPHER_PROFILE=1 also times the view refreshes and the background jobs
+    if setup():
+        for name in ("refresh_all", "_patch_output", "_update_output"):
+            setattr(ReciprocalCrackerGUI, name, timed(f"gui {name}", getattr(ReciprocalCrackerGUI, name)))
+        analyse_job = timed("job analyse", analyse_job)
+        seed_job = timed("job seed", seed_job)
+        solve_job = timed("job solve", solve_job)
     app = ReciprocalCrackerGUI()
-    app.mainloop()
\ No newline at end of file
+    app.mainloop()
+    report()
\ No newline at end of file
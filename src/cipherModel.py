@@ -0,0 +1,143 @@
+"""
+English n-gram language model compiled from words_alpha.txt
+
+build_model streams the word list once and counts every unigram, bigram, trigram and quadgram inside each word
+(never across two words), add-k smoothing turns the counts into log10 probabilities stored as dense float32
+arrays of length 26^n indexed by the base 26 packed n-gram (see cipherVec.pack_ngrams).
+
+The four tables are saved back to back in one .npy file under data/cache with the model version in the file name
+(table n starts at OFFSETS[n]), load_model memory maps it so every later run (and every worker process)
+starts in milliseconds without rebuilding.
+
+usage : python cipherModel.py [--force]
+
+"""
+import json
+import os
+import sys
+import tempfile
+from functools import lru_cache
+
+import numpy as np
+
+from cipherVec import BYTE_CODES, pack_within
+
+#bump whenever the counting or smoothing changes so stale caches get rebuilt
+MODEL_VERSION = 1
+ORDERS = (1, 2, 3, 4)
+SMOOTHING = 0.5
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+WORDS_PATH = os.path.join(DATA_DIR, "479k-english-words", "words_alpha.txt")
+CACHE_DIR = os.path.join(DATA_DIR, "cache")
+
+CHUNK_BYTES = 1 << 20
+
+#where each order starts inside the flat table
+OFFSETS = {}
+_offset = 0
+for _n in ORDERS:
+    OFFSETS[_n] = _offset
+    _offset += 26 ** _n
+TABLE_SIZE = _offset
+
+
+def table_path(cache_dir: str = CACHE_DIR) -> str:
+    return os.path.join(cache_dir, f"ngrams-v{MODEL_VERSION}.npy")
+
+
+def meta_path(cache_dir: str = CACHE_DIR) -> str:
+    return os.path.join(cache_dir, f"ngrams-v{MODEL_VERSION}.json")
+
+
+def source_stamp(words_path: str) -> dict:
+    st = os.stat(words_path)
+    return {"version": MODEL_VERSION, "size": st.st_size, "mtime": int(st.st_mtime), "smoothing": SMOOTHING}
+
+
+def word_chunks(words_path: str, chunk_bytes: int = CHUNK_BYTES):
+    #yields letter code arrays holding whole words only, the newlines (NOT_LETTER) are the gaps between words
+    tail = b""
+    with open(words_path, "rb") as f:
+        while True:
+            block = f.read(chunk_bytes)
+            if not block:
+                break
+            block = tail + block
+            cut = block.rfind(b"\n") + 1
+            tail = block[cut:]
+            yield BYTE_CODES[np.frombuffer(block[:cut], dtype=np.uint8)]
+    if tail:
+        yield BYTE_CODES[np.frombuffer(tail, dtype=np.uint8)]
+
+
+def count_ngrams(words_path: str = WORDS_PATH) -> dict:
+    counts = {n: np.zeros(26 ** n, dtype=np.int64) for n in ORDERS}
+    for codes in word_chunks(words_path):
+        for n in ORDERS:
+            counts[n] += np.bincount(pack_within(codes, n), minlength=26 ** n)
+    return counts
+
+
+def log_probs(counts: np.ndarray, k: float = SMOOTHING) -> np.ndarray:
+    total = counts.sum() + k * len(counts)
+    return np.log10((counts + k) / total).astype(np.float32)
+
+
+def build_model(words_path: str = WORDS_PATH, cache_dir: str = CACHE_DIR) -> np.ndarray:
+    counts = count_ngrams(words_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    if os.path.exists(meta_path(cache_dir)):
+        os.remove(meta_path(cache_dir))
+    flat = np.concatenate([log_probs(counts[n]) for n in ORDERS])
+    #saved next to the live table and swapped in whole: processes that have the old one memory mapped keep
+    #reading their (now unlinked) file instead of seeing it truncated under them
+    with tempfile.NamedTemporaryFile(dir=cache_dir, suffix=".npy.tmp", delete=False) as f:
+        tmp = f.name
+        np.save(f, flat)
+    os.replace(tmp, table_path(cache_dir))
+    #written last, a build that dies half way never looks valid
+    with tempfile.NamedTemporaryFile("w", dir=cache_dir, suffix=".json.tmp", delete=False) as f:
+        tmp = f.name
+        json.dump(source_stamp(words_path), f)
+    os.replace(tmp, meta_path(cache_dir))
+    return flat
+
+
+def cache_is_fresh(words_path: str = WORDS_PATH, cache_dir: str = CACHE_DIR) -> bool:
+    try:
+        with open(meta_path(cache_dir)) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if meta != source_stamp(words_path):
+        return False
+    return os.path.exists(table_path(cache_dir))
+
+
+@lru_cache(maxsize=None)
+def load_flat_model(words_path: str = WORDS_PATH, cache_dir: str = CACHE_DIR) -> np.ndarray:
+    """All orders in one read only float32 array (order n at OFFSETS[n]), built on first use."""
+    if not cache_is_fresh(words_path, cache_dir):
+        build_model(words_path, cache_dir)
+    #plain ndarray view of the memmap, same shared pages without the memmap indexing overhead
+    return np.load(table_path(cache_dir), mmap_mode="r").view(np.ndarray)
+
+
+def load_model(words_path: str = WORDS_PATH, cache_dir: str = CACHE_DIR) -> dict:
+    """n -> read only float32 log10 probability table of length 26^n."""
+    flat = load_flat_model(words_path, cache_dir)
+    return {n: flat[OFFSETS[n]:OFFSETS[n] + 26 ** n] for n in ORDERS}
+
+
+def main():
+    force = "--force" in sys.argv[1:]
+    if force or not cache_is_fresh():
+        build_model()
+        print(f"Model v{MODEL_VERSION} built into {CACHE_DIR}")
+    else:
+        print(f"Model v{MODEL_VERSION} already up to date in {CACHE_DIR}")
+
+
+if __name__ == "__main__":
+    main()
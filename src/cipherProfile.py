@@ -0,0 +1,232 @@
+"""
+Opt-in profiling of the front ends (cipherSubmit.py, cipherGraphical.py, cipherBatch.py)
+
+Turned on with --profile [PREFIX] on the command line or the CIPHER_PROFILE environment variable
+(1 for the summary only, anything else is taken as PREFIX). Nothing is wrapped or timed unless it is on.
+
+When on, install() wraps the hot functions in place (every module here that imported them by name sees the
+wrapped one): decode, letter_freq, top_trigrams, the stream helpers, word coverage, full and per move scoring
+(IncrementalScorer) and the solver loops. Each call records wall and cpu time (inclusive) and a call count,
+the per move scorer count is the number of solver iterations. Front ends time their own commands with span().
+report() prints the summary, and with a PREFIX also writes
+    PREFIX.pstats     cProfile data of every profiled thread (python -m pstats PREFIX.pstats)
+    PREFIX.collapsed  nested span stacks with their self time in microseconds, for flamegraph.pl / speedscope
+
+"""
+import atexit
+import cProfile
+import functools
+import importlib
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+ENV_VAR = "CIPHER_PROFILE"
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+#(module, attribute, name in the report), Class.method attributes are wrapped on the class
+TARGETS = [
+    ("cipherCore", "decode", "decode"),
+    ("cipherVec", "letter_freq", "letter_freq"),
+    ("cipherVec", "top_trigrams", "top_trigrams"),
+    ("cipherVec", "NgramStats.top", "ngram_stats_top"),
+    ("cipherVec", "letter_freq_stream", "letter_freq_stream"),
+    ("cipherVec", "decode_stream", "decode_stream"),
+    ("cipherVec", "DecodedView.sync", "decoded_view_sync"),
+    ("cipherWords", "coverage", "coverage"),
+    ("cipherWords", "WordCoverage.update", "coverage_update"),
+    ("cipherWords", "solve_by_patterns", "solve_by_patterns"),
+    ("cipherSolver", "IncrementalScorer.__init__", "score_full"),
+    ("cipherSolver", "IncrementalScorer.propose", "score_move"),
+    ("cipherSolver", "EncodedCipher.score_keys", "score_keys"),
+    ("cipherSolver", "SwapDeltas.apply", "swap_deltas_apply"),
+    ("cipherSolver", "steepest_climb", "steepest_climb"),
+    ("cipherSolver", "anneal", "anneal"),
+    ("cipherSolver", "hill_climb", "hill_climb"),
+    ("cipherSolver", "solve", "solve"),
+    ("cipherSolver", "solve_parallel", "solve_parallel"),
+    ("cipherExact", "solve_exact", "solve_exact"),
+]
+
+_state = {"on": False, "prefix": None, "reported": False}
+_lock = threading.Lock()
+#name -> [calls, wall seconds, cpu seconds]
+_stats = {}
+#"outer;inner" span stack -> self wall seconds
+_stacks = {}
+_profilers = []
+_local = threading.local()
+
+
+def enabled() -> bool:
+    return _state["on"]
+
+
+def setup(argv: list = None) -> bool:
+    """Turns profiling on from --profile [PREFIX] in argv (removed from it) or CIPHER_PROFILE, returns whether it is on."""
+    argv = sys.argv if argv is None else argv
+    prefix = None
+    on = False
+    if "--profile" in argv:
+        i = argv.index("--profile")
+        on = True
+        if i + 1 < len(argv) and not argv[i + 1].startswith("-"):
+            prefix = argv.pop(i + 1)
+        argv.pop(i)
+    elif os.environ.get(ENV_VAR, "") not in ("", "0"):
+        on = True
+        value = os.environ[ENV_VAR]
+        prefix = None if value == "1" else value
+    if on:
+        install(prefix)
+    return on
+
+
+def install(prefix: str = None) -> None:
+    if _state["on"]:
+        return
+    _state["on"] = True
+    _state["prefix"] = prefix
+    for module_name, attr, name in TARGETS:
+        module = importlib.import_module(module_name)
+        if "." in attr:
+            cls_name, method = attr.split(".")
+            cls = getattr(module, cls_name)
+            setattr(cls, method, timed(name, getattr(cls, method)))
+            continue
+        original = getattr(module, attr)
+        wrapped = timed(name, original)
+        #also replace the copies bound by `from module import attr` (the front end itself runs as __main__)
+        for other in list(sys.modules.values()):
+            if os.path.dirname(os.path.abspath(getattr(other, "__file__", None) or os.devnull)) == SRC_DIR:
+                for key, value in list(vars(other).items()):
+                    if value is original:
+                        setattr(other, key, wrapped)
+    profile_thread()
+    atexit.register(report)
+
+
+def profile_thread() -> None:
+    #cProfile only sees the thread that enabled it, worker threads call this first thing
+    #(only with a PREFIX to dump it to, it slows every python call down)
+    if _state["on"] and _state["prefix"] and getattr(_local, "profiler", None) is None:
+        _local.profiler = cProfile.Profile()
+        with _lock:
+            _profilers.append(_local.profiler)
+        _local.profiler.enable()
+
+
+def _record(name: str, wall: float, cpu: float, path: str, child: float) -> None:
+    with _lock:
+        entry = _stats.setdefault(name, [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += wall
+        entry[2] += cpu
+        _stacks[path] = _stacks.get(path, 0.0) + wall - child
+
+
+def _enter(name: str) -> list:
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    #[name, time spent in nested spans, wall start, cpu start]
+    frame = [name, 0.0, time.perf_counter(), time.thread_time()]
+    stack.append(frame)
+    return frame
+
+
+def _exit(frame: list) -> None:
+    wall = time.perf_counter() - frame[2]
+    cpu = time.thread_time() - frame[3]
+    stack = _local.stack
+    path = ";".join(f[0] for f in stack)
+    stack.pop()
+    if stack:
+        stack[-1][1] += wall
+    _record(frame[0], wall, cpu, path, frame[1])
+
+
+@contextmanager
+def span(name: str):
+    """Times the block under `name`, nested inside whatever span / wrapped call is running (no-op when off)."""
+    if not _state["on"]:
+        yield
+        return
+    frame = _enter(name)
+    try:
+        yield
+    finally:
+        _exit(frame)
+
+
+def timed(name: str, fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        frame = _enter(name)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _exit(frame)
+    return wrapper
+
+
+def snapshot(reset: bool = False) -> dict:
+    """Copy of the counters ({"stats": ..., "stacks": ...}), for worker processes to send back to their parent."""
+    with _lock:
+        data = {"stats": {k: list(v) for k, v in _stats.items()}, "stacks": dict(_stacks)}
+        if reset:
+            _stats.clear()
+            _stacks.clear()
+    return data
+
+
+def merge(data: dict) -> None:
+    with _lock:
+        for name, (calls, wall, cpu) in data["stats"].items():
+            entry = _stats.setdefault(name, [0, 0.0, 0.0])
+            entry[0] += calls
+            entry[1] += wall
+            entry[2] += cpu
+        for path, seconds in data["stacks"].items():
+            _stacks[path] = _stacks.get(path, 0.0) + seconds
+
+
+def summary() -> str:
+    rows = snapshot()["stats"]
+    lines = [f"{'name':<24}{'calls':>10}{'wall s':>11}{'cpu s':>11}{'per call':>12}"]
+    for name, (calls, wall, cpu) in sorted(rows.items(), key=lambda r: r[1][1], reverse=True):
+        lines.append(f"{name:<24}{calls:>10}{wall:>11.3f}{cpu:>11.3f}{wall / calls * 1e6:>10.1f}us")
+    return "\n".join(lines)
+
+
+def report(out=None) -> None:
+    """Prints the summary and writes the PREFIX files, once (later calls, e.g. from atexit, do nothing)."""
+    if not _state["on"] or _state["reported"]:
+        return
+    _state["reported"] = True
+    out = out or sys.stderr
+    print("\n[Profile] wall / cpu time include nested calls", file=out)
+    print(summary(), file=out)
+    prefix = _state["prefix"]
+    if not prefix:
+        return
+    with _lock:
+        profilers = list(_profilers)
+    for p in profilers:
+        p.disable()
+    stats = None
+    for p in profilers:
+        try:
+            stats = pstats.Stats(p) if stats is None else stats.add(p)
+        except TypeError:
+            #a thread that never ran any python code under its profiler
+            continue
+    if stats is not None:
+        stats.dump_stats(prefix + ".pstats")
+    with open(prefix + ".collapsed", "w") as f:
+        for path, seconds in sorted(snapshot()["stacks"].items()):
+            f.write(f"{path} {max(int(seconds * 1e6), 0)}\n")
+    print(f"[Profile] wrote {prefix}.pstats and {prefix}.collapsed", file=out)
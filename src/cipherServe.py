@@ -0,0 +1,407 @@
+"""
+Local HTTP / JSON cracking service
+
+usage : python cipherServe.py serve [--host 127.0.0.1] [--port 8765] [--workers N] [--queue 8] [--timeout 60] [--no-cache]
+        python cipherServe.py call ENDPOINT [JSON] [--port 8765]      (JSON from stdin when omitted)
+
+Every endpoint takes a POST with a JSON object and answers with one:
+
+    /seed    {"ciphertext"}                       -> {"key"}  frequency aligned seed (initial_reciprocal_mapping_by_frequency)
+    /decode  {"ciphertext", "key"}                -> {"plaintext"}
+    /stats   {"ciphertext", ["key"], ["top"]}     -> {"key", "frequencies", "trigrams", "score", "coverage"} of the key (the seed when omitted)
+    /solve   {"ciphertext", ["timeout"], ["seed"], ["refine"], ["method"]} -> {"key", "plaintext", "score", "coverage", "elapsed", "method", "timed_out", "cached"}
+    GET /health                                   -> {"ok", "workers", "running", "limit", "score_batches"}
+
+Keys are in the 26 letter form of cipherBatch / cipherCache. Bad input is a 400 with {"error": ...}.
+
+seed, decode and stats are cheap and run on the event loop (stats on a thread), the n-gram scores of stats requests
+that arrive together (within BATCH_WINDOW, up to BATCH_MAX of them) are computed in one vectorized pass
+(cipherSolver.score_texts). Solves go to a process pool of --workers processes set up like cipherBatch's
+(model memory mapped, word list loaded once per worker); at most workers + --queue solves are accepted at once,
+past that the service answers 503 with Retry-After instead of queueing without bound. A solve stops at its
+timeout (capped by --timeout, time spent waiting in the queue counts) and returns the best key so far with
+"timed_out": true. Known ciphertexts are answered from the solve cache (cipherCache) unless refine is set.
+The service only listens on the loopback address unless --host says otherwise.
+
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+
+from cipherBatch import init_worker
+from cipherCache import SolveCache, fingerprint
+from cipherCore import decode, initial_reciprocal_mapping_by_frequency, key_from_string, key_string
+from cipherProfile import enabled, merge, report, setup, snapshot
+from cipherSolver import METHODS
+from cipherVec import letter_freq, top_trigrams
+
+DEFAULT_PORT = 8765
+DEFAULT_TIMEOUT = 60.0
+MAX_BODY = 16 << 20
+#stats requests arriving within this many seconds of each other are scored together
+BATCH_WINDOW = 0.002
+BATCH_MAX = 64
+#a solve that has not answered this long after its deadline is given up on (504)
+GRACE = 10.0
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+           500: "Internal Server Error", 503: "Service Unavailable", 504: "Gateway Timeout"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str, headers: dict = None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+def solve_task(ct: str, deadline: float, seed=None, refine: bool = False, method: str = "anneal") -> dict:
+    #runs in a pool worker, the deadline is wall clock time so it means the same in every process
+    from cipherSolver import REFINE_ITERATIONS, REFINE_RESTARTS, solve
+    from cipherWords import coverage
+    start = time.perf_counter()
+    stop = lambda: time.time() >= deadline
+    if refine:
+        mapping, score = solve(ct, restarts=REFINE_RESTARTS, iterations=REFINE_ITERATIONS, seed=seed, target=None,
+                               stop=stop, method=method)
+    else:
+        mapping, score = solve(ct, seed=seed, stop=stop, method=method)
+    plain = decode(ct, mapping)
+    result = {
+        "key": key_string(mapping),
+        "plaintext": plain,
+        "score": score,
+        "coverage": coverage(plain)[1],
+        "elapsed": time.perf_counter() - start,
+        "method": method,
+        "timed_out": stop(),
+        "cached": False,
+    }
+    if enabled():
+        result["profile"] = snapshot(reset=True)
+    return result
+
+
+def score_batch(items: list) -> list:
+    #[(plaintext)] -> [(score, letter coverage)], runs on a thread
+    from cipherSolver import score_texts
+    from cipherWords import coverage
+    scores = score_texts(items)
+    return [(float(s), coverage(plain)[1]) for s, plain in zip(scores, items)]
+
+
+class ScoreBatcher:
+    """Collects the plaintexts of concurrent stats requests and scores them in one pass."""
+
+    def __init__(self, window: float = BATCH_WINDOW, max_items: int = BATCH_MAX):
+        self.window = window
+        self.max_items = max_items
+        self.pending = []
+        self.timer = None
+        self.batches = 0
+
+    async def score(self, plain: str) -> tuple:
+        fut = asyncio.get_running_loop().create_future()
+        self.pending.append((plain, fut))
+        if len(self.pending) >= self.max_items:
+            self.flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(self.window, self.flush)
+        return await fut
+
+    def flush(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending = self.pending, []
+        if batch:
+            self.batches += 1
+            asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch: list) -> None:
+        try:
+            results = await asyncio.to_thread(score_batch, [plain for plain, _ in batch])
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for (_, fut), result in zip(batch, results):
+            if not fut.done():
+                fut.set_result(result)
+
+
+def field(body: dict, name: str, kind=str):
+    value = body.get(name)
+    if not isinstance(value, kind):
+        raise HTTPError(400, f"'{name}' is required and must be a {kind.__name__}.")
+    return value
+
+
+def parse_key(body: dict) -> dict:
+    try:
+        return key_from_string(field(body, "key"))
+    except ValueError as e:
+        raise HTTPError(400, str(e))
+
+
+class CipherService:
+    def __init__(self, workers: int = None, queue: int = 8, timeout: float = DEFAULT_TIMEOUT,
+                 cache: SolveCache = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.limit = self.workers + queue
+        self.timeout = timeout
+        self.cache = cache
+        self.running = 0
+        self.batcher = ScoreBatcher()
+        self.pool = None
+        self.routes = {
+            ("POST", "/seed"): self.seed,
+            ("POST", "/decode"): self.decode,
+            ("POST", "/stats"): self.stats,
+            ("POST", "/solve"): self.solve,
+            ("GET", "/health"): self.health,
+        }
+
+    def start(self) -> None:
+        from cipherModel import load_flat_model
+        #build the model cache here so the workers only ever read it
+        load_flat_model()
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker, initargs=(enabled(),))
+
+    def close(self) -> None:
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+        if self.cache is not None:
+            self.cache.close()
+
+    async def seed(self, body: dict) -> dict:
+        return {"key": key_string(initial_reciprocal_mapping_by_frequency(field(body, "ciphertext")))}
+
+    async def decode(self, body: dict) -> dict:
+        return {"plaintext": decode(field(body, "ciphertext"), parse_key(body))}
+
+    async def stats(self, body: dict) -> dict:
+        ct = field(body, "ciphertext")
+        top = body.get("top", 10)
+        if not isinstance(top, int) or top < 0:
+            raise HTTPError(400, "'top' must be a non negative integer.")
+        mapping = parse_key(body) if "key" in body else initial_reciprocal_mapping_by_frequency(ct)
+        score, letters = await self.batcher.score(decode(ct, mapping).upper())
+        return {
+            "key": key_string(mapping),
+            "frequencies": letter_freq(ct),
+            "trigrams": top_trigrams(ct, top),
+            "score": score,
+            "coverage": letters,
+        }
+
+    async def solve(self, body: dict) -> dict:
+        ct = field(body, "ciphertext").upper()
+        timeout = body.get("timeout", self.timeout)
+        if not isinstance(timeout, (int, float)) or timeout <= 0:
+            raise HTTPError(400, "'timeout' must be a positive number of seconds.")
+        timeout = min(timeout, self.timeout)
+        refine = bool(body.get("refine", False))
+        seed = body.get("seed")
+        if seed is not None and not isinstance(seed, int):
+            raise HTTPError(400, "'seed' must be an integer.")
+        method = body.get("method", "anneal")
+        if method not in METHODS:
+            raise HTTPError(400, f"'method' must be one of {', '.join(METHODS)}.")
+
+        fp = hit = None
+        if self.cache is not None:
+            fp = fingerprint(ct)
+            hit = self.cache.get(fp)
+            if hit is not None and not refine:
+                return self.cached(ct, hit)
+
+        #backpressure: refuse rather than queue without bound
+        if self.running >= self.limit:
+            raise HTTPError(503, "Too many solves running, retry later.", {"Retry-After": "1"})
+        self.running += 1
+        try:
+            fut = asyncio.get_running_loop().run_in_executor(
+                self.pool, solve_task, ct, time.time() + timeout, seed, refine, method)
+        except BaseException:
+            self.running -= 1
+            raise
+        #the slot is held until the pool process is done, not just until this request gives up on it
+        fut.add_done_callback(self.release)
+        try:
+            result = await asyncio.wait_for(asyncio.shield(fut), timeout + GRACE)
+        except asyncio.TimeoutError:
+            raise HTTPError(504, "The solve did not finish in time.")
+        if "profile" in result:
+            merge(result.pop("profile"))
+        if self.cache is not None and not result["timed_out"]:
+            if not self.cache.put(fp, result["key"], result["coverage"], result["score"], result["plaintext"], method) \
+                    and hit is not None:
+                #an earlier run had found a better key
+                return self.cached(ct, hit)
+        return result
+
+    def release(self, fut: asyncio.Future) -> None:
+        self.running -= 1
+        if not fut.cancelled():
+            #a solve nobody waits for any more must not log "exception never retrieved"
+            fut.exception()
+
+    def cached(self, ct: str, hit: dict) -> dict:
+        return {"key": hit["key"], "plaintext": decode(ct, key_from_string(hit["key"])), "score": hit["score"],
+                "coverage": hit["coverage"], "elapsed": 0.0, "method": hit["method"], "timed_out": False, "cached": True}
+
+    async def health(self, body: dict) -> dict:
+        return {"ok": True, "workers": self.workers, "running": self.running, "limit": self.limit,
+                "score_batches": self.batcher.batches}
+
+    async def dispatch(self, method: str, path: str, raw: bytes) -> dict:
+        handler = self.routes.get((method, path))
+        if handler is None:
+            if any(p == path for _, p in self.routes):
+                raise HTTPError(405, f"{method} is not allowed on {path}.")
+            raise HTTPError(404, f"No endpoint {path}.")
+        body = {}
+        if raw:
+            try:
+                body = json.loads(raw)
+            except ValueError:
+                raise HTTPError(400, "Body is not valid JSON.")
+            if not isinstance(body, dict):
+                raise HTTPError(400, "Body must be a JSON object.")
+        return await handler(body)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        #HTTP/1.1 with keep alive, one request at a time per connection
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, raw = request
+                try:
+                    status, extra, payload = 200, {}, await self.dispatch(method, path, raw)
+                except HTTPError as e:
+                    status, extra, payload = e.status, e.headers, {"error": str(e)}
+                except Exception as e:
+                    status, extra, payload = 500, {}, {"error": f"{type(e).__name__}: {e}"}
+                keep = headers.get("connection", "").lower() != "close"
+                writer.write(response(status, payload, extra, keep))
+                await writer.drain()
+                if not keep:
+                    break
+        except HTTPError as e:
+            writer.write(response(e.status, {"error": str(e)}, e.headers, False))
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def read_request(reader: asyncio.StreamReader):
+    #(method, path, lower case headers, body) or None once the client hung up
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    try:
+        method, target, _ = line.decode("latin-1").split()
+    except ValueError:
+        raise HTTPError(400, "Malformed request line.")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length", "0") or 0)
+    except ValueError:
+        raise HTTPError(400, "Content-Length must be an integer.")
+    if length < 0:
+        raise HTTPError(400, "Content-Length must not be negative.")
+    if length > MAX_BODY:
+        raise HTTPError(413, f"Bodies are limited to {MAX_BODY} bytes.")
+    raw = await reader.readexactly(length) if length else b""
+    return method.upper(), target.split("?")[0], headers, raw
+
+
+def response(status: int, payload: dict, headers: dict = None, keep: bool = True) -> bytes:
+    body = json.dumps(payload).encode("utf-8")
+    lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}", "Content-Type: application/json",
+             f"Content-Length: {len(body)}", f"Connection: {'keep-alive' if keep else 'close'}"]
+    lines += [f"{k}: {v}" for k, v in (headers or {}).items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+
+async def serve(service: CipherService, host: str = "127.0.0.1", port: int = DEFAULT_PORT) -> None:
+    service.start()
+    server = await asyncio.start_server(service.handle, host, port)
+    print(f"Serving on http://{host}:{port} ({service.workers} solve workers, {service.limit} solves at most)",
+          file=sys.stderr)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+def call(endpoint: str, payload: dict = None, host: str = "127.0.0.1", port: int = DEFAULT_PORT,
+         timeout: float = None) -> tuple:
+    """(status, JSON answer) of one request to a running service, GET when payload is None."""
+    data = None if payload is None else json.dumps(payload).encode("utf-8")
+    req = urllib.request.Request(f"http://{host}:{port}/{endpoint.lstrip('/')}", data=data,
+                                 headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.status, json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b"{}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local HTTP / JSON service around the reciprocal cipher solver.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    srv = sub.add_parser("serve", help="run the service")
+    srv.add_argument("--host", default="127.0.0.1", help="address to listen on (default: loopback only)")
+    srv.add_argument("--port", type=int, default=DEFAULT_PORT)
+    srv.add_argument("--workers", type=int, default=None, help="solve worker processes (default: all cores)")
+    srv.add_argument("--queue", type=int, default=8, help="solves waiting for a worker before answering 503")
+    srv.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="longest a solve may take, in seconds")
+    srv.add_argument("--no-cache", action="store_true", help="never read or update the solve cache")
+
+    cl = sub.add_parser("call", help="send one request to a running service and print the answer")
+    cl.add_argument("endpoint", help="seed, decode, stats, solve or health")
+    cl.add_argument("json", nargs="?", help="request body, read from stdin when omitted (health needs none)")
+    cl.add_argument("--host", default="127.0.0.1")
+    cl.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+
+    if args.cmd == "call":
+        payload = None
+        if args.endpoint.strip("/") != "health":
+            payload = json.loads(args.json if args.json is not None else sys.stdin.read())
+        status, answer = call(args.endpoint, payload, args.host, args.port)
+        print(json.dumps(answer, indent=1))
+        sys.exit(0 if status == 200 else 1)
+
+    setup([])
+    service = CipherService(args.workers, args.queue, args.timeout, None if args.no_cache else SolveCache())
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    report()
+
+
+if __name__ == "__main__":
+    main()
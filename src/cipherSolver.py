@@ -0,0 +1,488 @@
+"""
+Automatic reciprocal cipher solver
+
+Starts from the frequency aligned seed (initial_reciprocal_mapping_by_frequency) and runs
+random restart hill climbing / simulated annealing over reciprocal keys.
+Every move is a single associate(a, b) so the key stays an involution the whole time,
+and each candidate is scored with the english n-gram model compiled from words_alpha.txt (cipherModel):
+quadgrams inside every word, and the matching lower order table for words shorter than 4 letters.
+Inside the search keys are ReciprocalKey objects (26 bytes, O(1) associate), the public functions hand back plain dicts.
+EncodedCipher.score_keys scores a whole population of keys ((K, 26) uint8 partner codes) in one NumPy gather,
+solve(method="steepest") climbs deterministically, always taking the best of all 325 associate moves from a 26x26
+delta matrix (SwapDeltas) that is only partly rescored after each move
+
+"""
+import math
+import multiprocessing
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from cipherCore import (
+    ALPHABET,
+    ReciprocalKey,
+    initial_reciprocal_mapping_by_frequency,
+    is_reciprocal,
+)
+from cipherModel import OFFSETS, load_flat_model, load_model
+from cipherVec import encode_words, pack_whole_words, pack_within, unpack_codes
+from cipherWords import WordCoverage, word_set
+
+ORDER = 4
+#anneal: random moves with simulated annealing then hill climbing, steepest: deterministic best move climbing (SwapDeltas)
+METHODS = ("anneal", "steepest")
+#fraction of decrypted letters inside dictionary words at which a key counts as solved
+SOLVED_COVERAGE = 0.9
+#refine (solve refine, cipherBatch --refine, "refine" in the service) searches this much harder and never stops early
+REFINE_RESTARTS = 32
+REFINE_ITERATIONS = 8000
+
+
+def windows(text: str, order: int = ORDER) -> dict:
+    #k -> packed letter k-grams that get scored: every order-gram inside a word plus the whole short words
+    seq = encode_words(text)
+    found = {order: pack_within(seq, order)}
+    for k in range(1, order):
+        found[k] = pack_whole_words(seq, k)
+    return found
+
+
+def fitness(text: str) -> float:
+    #sum of n-gram log probabilities of an already decoded text
+    tables = load_model()
+    return float(sum(tables[k][packed].astype(np.float64).sum() for k, packed in windows(text).items()))
+
+
+def score_texts(texts: list) -> np.ndarray:
+    """fitness() of many decoded texts at once, one gather over the flat model for all of them."""
+    table = load_flat_model()
+    index, owner = [], []
+    for n, text in enumerate(texts):
+        for k, packed in windows(text).items():
+            index.append(packed.astype(np.int64) + OFFSETS[k])
+            owner.append(np.full(len(packed), n, dtype=np.int64))
+    if not index:
+        return np.zeros(len(texts))
+    values = table[np.concatenate(index)].astype(np.float64)
+    return np.bincount(np.concatenate(owner), weights=values, minlength=len(texts))
+
+
+def random_pair(rng: random.Random) -> tuple:
+    a, b = rng.sample(ALPHABET, 2)
+    return a, b
+
+
+def random_move(mapping, rng: random.Random) -> ReciprocalKey:
+    #one associate style pair swap on a copy of the key
+    candidate = ReciprocalKey.from_mapping(mapping)
+    candidate.associate(*random_pair(rng))
+    return candidate
+
+
+#score_keys works through the population in slices of about this many window lookups
+SCORE_CELLS = 1 << 22
+#every unordered letter pair (a < b), one associate move each
+PAIRS_A, PAIRS_B = np.triu_indices(26, k=1)
+
+
+class EncodedCipher:
+    """
+    The scored windows of one ciphertext, ready to be looked up under any key.
+
+    Every scored window (quadgrams inside words, whole short words) is one row of cipher letter codes,
+    identical windows are merged and weighted by how often they occur. score_keys() scores a whole
+    population of keys ((K, 26) uint8 partner codes) with one gather into the n-gram table.
+    """
+
+    def __init__(self, ct: str):
+        self.table = load_flat_model()
+        #one row per distinct window, short words are left padded with code 26 which always decodes to digit 0
+        grams, offsets, weights = [], [], []
+        for k, packed in windows(ct.upper()).items():
+            uniq, counts = np.unique(packed, return_counts=True)
+            pad = np.full((len(uniq), ORDER - k), 26, dtype=np.uint8)
+            grams.append(np.hstack([pad, unpack_codes(uniq, k)]))
+            offsets.append(np.full(len(uniq), OFFSETS[k], dtype=np.int64))
+            weights.append(counts.astype(np.float64))
+        self.grams = np.vstack(grams)
+        self.offsets = np.concatenate(offsets)
+        self.weights = np.concatenate(weights)
+        self.powers = 26 ** np.arange(ORDER - 1, -1, -1, dtype=np.int64)
+        #member[c] = which windows contain cipher letter c
+        self.member = np.stack([(self.grams == i).any(axis=1) for i in range(26)])
+
+    def score_keys(self, keys: np.ndarray, rows=None) -> np.ndarray:
+        """
+        fitness of every row of keys ((K, 26) partner codes) over this ciphertext, as K floats.
+        With rows (window indices) only those windows are summed.
+        """
+        keys = np.asarray(keys, dtype=np.uint8)
+        if keys.ndim != 2 or keys.shape[1] != 26:
+            raise ValueError("keys must be a (K, 26) array of partner codes.")
+        grams, offsets, weights = self.grams, self.offsets, self.weights
+        if rows is not None:
+            grams, offsets, weights = grams[rows], offsets[rows], weights[rows]
+        #column 26 is the padding code, it decodes to digit 0 like in IncrementalScorer
+        padded = np.hstack([keys, np.zeros((len(keys), 1), dtype=np.uint8)])
+        out = np.empty(len(keys))
+        step = max(1, SCORE_CELLS // max(len(grams), 1))
+        for start in range(0, len(keys), step):
+            plain = padded[start:start + step][:, grams]
+            idx = plain @ self.powers + offsets
+            out[start:start + step] = self.table[idx].astype(np.float64) @ weights
+        return out
+
+
+def key_array(mappings) -> np.ndarray:
+    #(K, 26) uint8 partner codes of a list of keys (dicts or ReciprocalKey)
+    return np.frombuffer(b"".join(ReciprocalKey.from_mapping(m).pairs for m in mappings),
+                         dtype=np.uint8).reshape(-1, 26).copy()
+
+
+def neighbour_keys(key: np.ndarray) -> np.ndarray:
+    """
+    All 325 associate(a, b) neighbours of key (26 partner codes) as a (325, 26) array, row n is the pair
+    (PAIRS_A[n], PAIRS_B[n]). Pairs that are already partners give the key itself back.
+    """
+    key = np.asarray(key, dtype=np.uint8)
+    a, b = PAIRS_A, PAIRS_B
+    oa, ob = key[a].astype(np.intp), key[b].astype(np.intp)
+    rows = np.arange(len(a))
+    out = np.tile(key, (len(a), 1))
+    move = oa != b
+    #the old partners pair up, or go back to themselves when only one is left over (same as ReciprocalKey.associate)
+    lone_a = move & (oa != a)
+    lone_b = move & (ob != b)
+    out[rows[move], a[move]] = b[move]
+    out[rows[move], b[move]] = a[move]
+    out[rows[lone_a], oa[lone_a]] = np.where(lone_b, ob, oa)[lone_a]
+    out[rows[lone_b], ob[lone_b]] = np.where(lone_a, oa, ob)[lone_b]
+    return out
+
+
+class SwapDeltas:
+    """
+    26x26 matrix of the score change of every associate(a, b) move from the current key, kept up to date.
+
+    A move's delta only depends on the windows holding one of its letters (a, b and their partners).
+    After apply() only the moves with a letter that shares a window with a changed letter are rescored,
+    as one population over just the windows they touch, every other entry keeps its delta.
+    """
+
+    def __init__(self, ct, mapping: dict):
+        self.cipher = ct if isinstance(ct, EncodedCipher) else EncodedCipher(ct)
+        member = self.cipher.member.astype(np.int32)
+        #near[x, y]: x and y appear together in at least one window
+        self.near = (member @ member.T) > 0
+        self.key = np.frombuffer(ReciprocalKey.from_mapping(mapping).pairs, dtype=np.uint8).copy()
+        self.score = float(self.cipher.score_keys(self.key[None])[0])
+        self.delta = np.zeros((26, 26))
+        #moves rescored so far (325 for the first fill)
+        self.rescored = 0
+        self._rescore(np.ones(len(PAIRS_A), dtype=bool))
+
+    def _rescore(self, moves: np.ndarray) -> None:
+        a, b = PAIRS_A[moves], PAIRS_B[moves]
+        if not len(a):
+            return
+        letters = np.unique(np.concatenate([a, b, self.key[a], self.key[b]]))
+        rows = np.flatnonzero(self.cipher.member[letters].any(axis=0))
+        current = self.cipher.score_keys(self.key[None], rows)[0]
+        d = self.cipher.score_keys(neighbour_keys(self.key)[moves], rows) - current
+        self.delta[a, b] = d
+        self.delta[b, a] = d
+        self.rescored += len(a)
+
+    def best(self) -> tuple:
+        #(a, b, delta) of the best move, ties go to the first pair in A..Z order
+        n = int(np.argmax(self.delta[PAIRS_A, PAIRS_B]))
+        a, b = int(PAIRS_A[n]), int(PAIRS_B[n])
+        return a, b, float(self.delta[a, b])
+
+    def apply(self, a: int, b: int) -> tuple:
+        """Makes associate(a, b) (letter codes) the current key, returns the changed codes."""
+        key = ReciprocalKey(self.key.tobytes())
+        changed = list(key.associate_codes(a, b))
+        if not changed:
+            return ()
+        self.score += float(self.delta[a, b])
+        self.key = np.frombuffer(key.pairs, dtype=np.uint8).copy()
+        dirty = self.near[changed].any(axis=0)
+        dirty[changed] = True
+        k = self.key
+        self._rescore(dirty[PAIRS_A] | dirty[PAIRS_B] | dirty[k[PAIRS_A]] | dirty[k[PAIRS_B]])
+        return tuple(changed)
+
+    def mapping(self) -> ReciprocalKey:
+        return ReciprocalKey(self.key.tobytes())
+
+
+def steepest_climb(ct, mapping: dict, max_steps: int = 1000, stop=None) -> tuple:
+    """
+    Deterministic climbing: every step takes the best of all 325 associate moves (SwapDeltas)
+    until none improves. Returns (ReciprocalKey, score).
+    """
+    deltas = SwapDeltas(ct, mapping)
+    for _ in range(max_steps):
+        if stop is not None and stop():
+            break
+        a, b, gain = deltas.best()
+        if gain <= 1e-9:
+            break
+        deltas.apply(a, b)
+    return deltas.mapping(), deltas.score
+
+
+class IncrementalScorer:
+    """
+    Keeps the fitness of one key over one ciphertext and rescores only what a move touches.
+
+    The windows come from EncodedCipher and are indexed by the cipher letters in them. An associate
+    changes the plaintext of at most 4 cipher letters so only the windows holding one of those letters
+    get looked up again, the rest of the text is never read.
+    """
+
+    def __init__(self, ct, mapping: dict):
+        cipher = ct if isinstance(ct, EncodedCipher) else EncodedCipher(ct)
+        self.table = cipher.table
+        self.grams = cipher.grams
+        self.offsets = cipher.offsets
+        self.weights = cipher.weights
+        self.powers = cipher.powers
+        self.member = cipher.member
+
+        self.mapping = ReciprocalKey.from_mapping(mapping)
+        self.key = np.append(np.frombuffer(self.mapping.pairs, dtype=np.uint8), np.uint8(0))
+        self.scores = self._score_rows(self.key, slice(None))
+        self.score = float(np.dot(self.scores, self.weights))
+
+    def _score_rows(self, key: np.ndarray, ids) -> np.ndarray:
+        return self.table[key[self.grams[ids]] @ self.powers + self.offsets[ids]].astype(np.float64)
+
+    def propose(self, a: str, b: str) -> tuple:
+        #returns (delta, move) for associate(a, b) without touching the current key
+        candidate = self.mapping.copy()
+        changed = list(candidate.associate(a, b))
+        if not changed:
+            return 0.0, (candidate, self.key, None, None)
+
+        key = self.key.copy()
+        for i in changed:
+            key[i] = candidate.code(i)
+        ids = np.flatnonzero(self.member[changed].any(axis=0))
+        new = self._score_rows(key, ids)
+        delta = float(np.dot(new - self.scores[ids], self.weights[ids]))
+        return delta, (candidate, key, ids, new)
+
+    def accept(self, delta: float, move: tuple) -> None:
+        candidate, key, ids, new = move
+        self.mapping = candidate
+        self.key = key
+        if ids is not None:
+            self.scores[ids] = new
+        self.score += delta
+
+
+#how many moves run between two looks at the stop flag
+STOP_CHECK = 256
+
+
+def anneal(ct, mapping: dict, rng: random.Random, iterations: int = 4000,
+           start_temp: float = 10.0, end_temp: float = 0.2, stop=None) -> tuple:
+    #ct is the text or its EncodedCipher, pass the latter when several runs share one ciphertext
+    scorer = IncrementalScorer(ct, mapping)
+    best, best_score = scorer.mapping.copy(), scorer.score
+
+    for step in range(iterations):
+        if stop is not None and step % STOP_CHECK == 0 and stop():
+            break
+        #geometric cooling from start_temp down to end_temp
+        temp = start_temp * (end_temp / start_temp) ** (step / max(iterations - 1, 1))
+        delta, move = scorer.propose(*random_pair(rng))
+        if delta >= 0 or rng.random() < math.exp(delta / temp):
+            scorer.accept(delta, move)
+            if scorer.score > best_score:
+                best, best_score = scorer.mapping.copy(), scorer.score
+
+    return best, best_score
+
+
+def hill_climb(ct, mapping: dict, rng: random.Random, patience: int = 1000, stop=None) -> tuple:
+    #plain first improvement climbing, stops once no swap helped for `patience` tries (ct as in anneal)
+    scorer = IncrementalScorer(ct, mapping)
+    misses = 0
+    tries = 0
+    while misses < patience:
+        tries += 1
+        if stop is not None and tries % STOP_CHECK == 0 and stop():
+            break
+        delta, move = scorer.propose(*random_pair(rng))
+        if delta > 0:
+            scorer.accept(delta, move)
+            misses = 0
+        else:
+            misses += 1
+    return scorer.mapping, scorer.score
+
+
+def rank_keys(ct: str, mappings: list) -> list:
+    """[(mapping, letter coverage, score)] best first, dictionary coverage first and n-gram score to break ties."""
+    ct = ct.upper()
+    if not mappings:
+        return []
+    coverage = WordCoverage(ct, mappings[0])
+    scores = EncodedCipher(ct).score_keys(key_array(mappings))
+    ranked = []
+    for mapping, score in zip(mappings, scores):
+        coverage.update(mapping)
+        ranked.append((dict(mapping), coverage.letter_fraction, float(score)))
+    ranked.sort(key=lambda r: (r[1], r[2]), reverse=True)
+    return ranked
+
+
+def restart(ct, start: dict, rng: random.Random, r: int, iterations: int = 4000, stop=None,
+            method: str = "anneal") -> tuple:
+    #one annealing + climbing run, restart 0 keeps the pure frequency seed, the others get shaken up a bit
+    mapping = ReciprocalKey.from_mapping(start)
+    if r > 0:
+        for _ in range(rng.randint(2, 6)):
+            mapping = random_move(mapping, rng)
+    if method == "steepest":
+        return steepest_climb(ct, mapping, stop=stop)
+    mapping, score = anneal(ct, mapping, rng, iterations=iterations, stop=stop)
+    return hill_climb(ct, mapping, rng, stop=stop)
+
+
+def solve(ct: str, restarts: int = 8, iterations: int = 4000, seed=None, target: float = SOLVED_COVERAGE,
+          stop=None, progress=None, method: str = "anneal") -> tuple:
+    """
+    Crack a reciprocal cipher, returns (mapping, score) of the best key found.
+
+    method "steepest" climbs by always taking the best move and is reproducible (seed defaults to 0).
+    stop() is polled every STOP_CHECK moves and ends the search early with the best key so far,
+    progress(best mapping, best score, moves so far) is called just as often (both for front ends running this on a thread).
+    """
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {', '.join(METHODS)}.")
+    if method == "steepest" and seed is None:
+        seed = 0
+    rng = random.Random(seed)
+    ct = ct.upper()
+    start = initial_reciprocal_mapping_by_frequency(ct)
+    #windows of the ciphertext, shared by every restart
+    cipher = EncodedCipher(ct)
+
+    coverage = WordCoverage(ct, start)
+    best, best_score = dict(start), IncrementalScorer(cipher, start).score
+    best_rank = (coverage.letter_fraction, best_score)
+
+    moves = 0
+
+    def check() -> bool:
+        nonlocal moves
+        moves += STOP_CHECK
+        if progress is not None:
+            progress(best, best_score, moves)
+        return stop is not None and stop()
+
+    hook = check if stop is not None or progress is not None else None
+    for r in range(restarts):
+        if stop is not None and stop():
+            break
+        mapping, score = restart(cipher, start, rng, r, iterations, stop=hook, method=method)
+        #keys are ranked by dictionary coverage first, the n-gram score breaks ties
+        coverage.update(mapping)
+        rank = (coverage.letter_fraction, score)
+        if rank > best_rank:
+            best, best_score, best_rank = mapping, score, rank
+        #enough of the text reads as real words, no point in more restarts
+        if target is not None and best_rank[0] >= target:
+            break
+
+    if not is_reciprocal(best):
+        raise RuntimeError("Solver produced a non reciprocal key.")
+    return dict(best), best_score
+
+
+#set in every worker of solve_parallel by init_restart_worker
+_shared = {}
+
+
+def init_restart_worker(best_score, stop_event) -> None:
+    _shared["best"] = best_score
+    _shared["stop"] = stop_event
+    load_flat_model()
+    word_set()
+
+
+def restart_task(ct: str, r: int, seed: int, iterations: int, target, target_score, method: str = "anneal"):
+    stop = _shared["stop"]
+    if stop.is_set():
+        return None
+    rng = random.Random(seed)
+    start = initial_reciprocal_mapping_by_frequency(ct)
+    #encoded once, annealing and climbing of this restart both score against it
+    cipher = EncodedCipher(ct)
+    mapping, score = restart(cipher, start, rng, r, iterations, stop=stop.is_set, method=method)
+    letters = WordCoverage(ct, mapping).letter_fraction
+
+    best = _shared["best"]
+    with best.get_lock():
+        if score > best.value:
+            best.value = score
+    #solved by either criterion: tell every other worker to stop
+    if (target is not None and letters >= target) or (target_score is not None and best.value >= target_score):
+        stop.set()
+    return mapping, score, letters
+
+
+def solve_parallel(ct: str, restarts: int = None, workers: int = None, iterations: int = 4000, seed=None,
+                   target: float = SOLVED_COVERAGE, target_score: float = None, method: str = "anneal") -> tuple:
+    """
+    solve() with the restarts spread over worker processes, returns (mapping, score).
+
+    Every worker sees the best n-gram score found so far and a shared stop flag, the first restart that
+    reaches the target coverage (or target_score) raises the flag, queued restarts are cancelled and
+    running ones give up at their next check (so with early stopping even "steepest" can end on another restart).
+    """
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {', '.join(METHODS)}.")
+    if method == "steepest" and seed is None:
+        seed = 0
+    workers = workers or os.cpu_count() or 1
+    restarts = restarts or max(8, workers)
+    if workers == 1:
+        return solve(ct, restarts=restarts, iterations=iterations, seed=seed, target=target, method=method)
+
+    ct = ct.upper()
+    #build the cache here so the workers only ever read it
+    load_flat_model()
+    base = random.Random(seed)
+    seeds = [base.randrange(2 ** 32) for _ in range(restarts)]
+
+    best_score = multiprocessing.Value("d", -math.inf)
+    stop = multiprocessing.Event()
+    start = initial_reciprocal_mapping_by_frequency(ct)
+    best, best_rank = dict(start), (WordCoverage(ct, start).letter_fraction, IncrementalScorer(ct, start).score)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_restart_worker,
+                             initargs=(best_score, stop)) as pool:
+        futures = [pool.submit(restart_task, ct, r, seeds[r], iterations, target, target_score, method)
+                   for r in range(restarts)]
+        for fut in as_completed(futures):
+            if fut.cancelled():
+                continue
+            result = fut.result()
+            if result is not None:
+                mapping, score, letters = result
+                if (letters, score) > best_rank:
+                    best, best_rank = mapping, (letters, score)
+            if stop.is_set():
+                for f in futures:
+                    f.cancel()
+
+    if not is_reciprocal(best):
+        raise RuntimeError("Solver produced a non reciprocal key.")
+    return dict(best), best_rank[1]
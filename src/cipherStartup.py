@@ -0,0 +1,69 @@
+"""
+Startup time budget of the terminal entry points
+
+usage : python cipherStartup.py [--runs N]
+
+Imports every non graphical entry point in a fresh interpreter under python -X importtime (best of N runs)
+and exits with status 1 when one takes longer than its budget or loads at startup a module that should
+only come in on first use (matplotlib for graph, the solver and model for solve, tkinter never).
+
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+#module -> (budget in ms for the whole import, modules it must not pull in at startup)
+BUDGETS = {
+    "cipherCore": (250, ("matplotlib", "tkinter", "cipherModel", "cipherSolver", "cipherWords")),
+    "cipher": (250, ("matplotlib", "tkinter", "cipherModel", "cipherSolver", "cipherWords")),
+    "cipherSubmit": (300, ("matplotlib", "tkinter", "cipherModel", "cipherSolver", "cipherWords")),
+    "cipherBatch": (400, ("matplotlib", "tkinter")),
+}
+
+
+def import_times(module: str) -> dict:
+    #module name -> cumulative import time in microseconds, from one fresh interpreter
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=SRC_DIR, capture_output=True, text=True, check=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def check(module: str, banned: tuple, runs: int = 3) -> tuple:
+    """(import ms, banned modules that got imported) of module, best of `runs` fresh interpreters."""
+    best, loaded = None, set()
+    for _ in range(runs):
+        times = import_times(module)
+        ms = times[module] / 1000
+        best = ms if best is None else min(best, ms)
+        loaded.update(times)
+    found = sorted(b for b in banned if any(name == b or name.startswith(b + ".") for name in loaded))
+    return best, found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the import time of the terminal entry points.")
+    parser.add_argument("--runs", type=int, default=3, help="fresh interpreters per module, the fastest counts")
+    args = parser.parse_args()
+
+    failed = False
+    for module, (budget_ms, banned) in BUDGETS.items():
+        ms, found = check(module, banned, args.runs)
+        ok = ms <= budget_ms and not found
+        failed |= not ok
+        note = f"   imports {', '.join(found)}" if found else ""
+        print(f"{'ok  ' if ok else 'FAIL'} {module:<14}{ms:7.1f} ms  (budget {budget_ms} ms){note}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,9 +4,23 @@ Homework 3 CS351
  
 """
 import sys
-from collections import Counter
-from operator import itemgetter
-import matplotlib.pyplot as plt
+
+from cipherCore import (
+    ALPHABET,
+    COMMON_FREQ,
+    COMMON_VALS,
+    KeyHistory,
+    decode,
+    is_reciprocal,
+    key_from_string,
+    key_string,
+    letter_freq,
+    make_identity_pairs,
+    mapping_by_frequency,
+    ngram_stats,
+)
+from cipherProfile import report, setup, span
+from cipherVec import DecodedView, decode_stream, key_table, letter_freq_stream, map_file
 
 """
 
@@ -40,145 +54,25 @@ The logic and assumptions is as follows:
 
     9a) user can reset to origianl mapping with reset 
     9b) user can check that the mapping is reciprocal using check comand 
+    9c) every change to the mapping (assoc, mapbyfreq, solve, patterns, exact, reset, restore) can be undone / redone, 
+        save NAME / restore NAME keep named checkpoints of the mapping to come back to 
     
 """
 
 
-# global from : https://mathcenter.oxford.emory.edu/site/math125/englishLetterFreqs/
-COMMON_FREQ = "ETAOINSHRDLCUMWFGYPBVKJXQZ"
-COMMON_VALS = [
-    0.12702, 0.09056, 0.08167, 0.07507, 0.06966, 0.06749, 0.06327, 0.06094, 0.05987,
-    0.04253, 0.04025, 0.02782, 0.02758, 0.02406, 0.02360, 0.02228, 0.02015, 0.01974,
-    0.01929, 0.01492, 0.00978, 0.00772, 0.00153, 0.00150, 0.00095, 0.00074
-]
-ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
-
-def letter_freq(text: str) -> dict:
-    #get a list of all the letters in the cipher text
-    letters = [ch for ch in text.upper() if ch.isalpha()]
-    total = len(letters)
-    #initialize to 0 for all characters 
-    freqs = {c: 0.0 for c in ALPHABET}
-    if total == 0:
-        return freqs
-    #Counter is an object that returns counts of iterable objects in this case the list of letters
-    counts = Counter(letters)
-    #compute the actual frequencies 
-    for c in ALPHABET:
-        freqs[c] = counts.get(c, 0) / total
-    return freqs
-
-def make_identity_pairs() -> dict:
-    #map each character to itself initially 
-    return {c: c for c in ALPHABET}
-
-def is_reciprocal(mapping: dict) -> bool:
-    #sanity check for reciprocity of mapping 
-    for a in ALPHABET:
-        #b is the pair of a 
-        b = mapping.get(a, a)
-        if b not in ALPHABET:
-            return False
-        # check that a is the pair of b
-        if mapping.get(b, b) != a:
-            return False
-    return True
-
-def set_pair(mapping: dict, a: str, b: str) -> None:
-
-    a = a.upper()
-    b = b.upper()
-    
-    if a not in ALPHABET or b not in ALPHABET:
-        raise ValueError("Letters must be A-Z.")
-    #association of 2 letters reciprocally 
-    mapping[a] = b
-    mapping[b] = a
-
-def initial_reciprocal_mapping_by_frequency(ct: str) -> dict:
-    freqs = letter_freq(ct)
-    # the original frequencies is indescending order so we sort this in reverse so they can be matched
-    ranked = sorted(freqs, key=freqs.get, reverse=True)
-
-    mapping = make_identity_pairs()
-    
-    #to avoid duplicate entries
-    used = set()
-
-    i = 0
-    j = 0
-    #map new pairs : most frequent in cipher to most frequent from common freq
-    while i < len(ranked) and j < len(COMMON_FREQ):
-        c = ranked[i]
-        p = COMMON_FREQ[j]
-        i += 1
-        j += 1
-
-        if c in used or p in used:
-            continue
+#a ciphertext loaded from a file is memory mapped, these cap how much of it show prints and solve reads
+PREVIEW_CHARS = 4000
+SAMPLE_BYTES = 1 << 20
+#default time budget of the exact branch and bound search, in seconds
+EXACT_SECONDS = 10.0
+
+#solve results of earlier sessions (cipherCache), opened on first use
+_cache = {}
+
+def show_graph(ct_freq: dict):
+    #matplotlib takes longer to import than everything else together, only graph pays for it
+    import matplotlib.pyplot as plt
 
-        set_pair(mapping, c, p)
-        used.add(c)
-        used.add(p)
-
-    return mapping
-
-def decode(text: str, mapping: dict) -> str:
-    out = []
-    #making the substitutions in the actual cipher
-    for ch in text:
-        if ch.isalpha():
-            up = ch.upper()
-            out.append(mapping.get(up, up))
-        else:
-            out.append(ch)
-    return "".join(out)
-
-def associate(mapping: dict, a: str, b: str) -> None:
-    #association in plce of swapping so any 2 letters a and b can be associated at runtime
-    a = a.upper()
-    b = b.upper()
-    if a not in ALPHABET or b not in ALPHABET:
-        raise ValueError("Letters must be A-Z.")
-    if a == b:
-        return
-
-    old_a_partner = mapping.get(a, a)
-    old_b_partner = mapping.get(b, b)
-
-
-    set_pair(mapping, a, b)
-
-    # remove the pairing of the old partners to the associated values
-    orphans = {old_a_partner, old_b_partner} - {a, b}
-
-
-    if len(orphans) == 2:
-        o1, o2 = orphans
-        set_pair(mapping, o1, o2)
-    #if one of the letters was mapped to itself 
-    elif len(orphans) == 1:
-
-        o1 = orphans.pop()
-        set_pair(mapping, o1, o1)
-
-def top_trigrams(text: str, n: int = 10) -> list:
-    #get all the letters in the text
-    letters = [ch for ch in text.upper() if ch.isalpha()]
-    if len(letters) < 3:
-        return []
-    #compute the trigrams as the groupings of 3 letters from each initial position to the end of the text 
-    trigs = (letters[i] + letters[i + 1] + letters[i + 2] for i in range(len(letters) - 2))
-    # most commmon is a built in function that returns the n most common elements in descending order
-    return Counter(trigs).most_common(n)
-
-def show_graph(ct: str):
-    
-    if not ct.strip():
-        print("Error: Load ciphertext first before graphing.")
-        return
-    
-    ct_freq = letter_freq(ct.upper())
     #zip here is used to pair frequencies to the common letters pairwise,
     english_by_letter = {ch: val for ch, val in zip(COMMON_FREQ, COMMON_VALS)}
     #x-axis value
@@ -204,25 +98,74 @@ def show_graph(ct: str):
     print("Graph opened in a new window. Close the window to continue typing commands.")
     plt.show()
 
+def file_freq(path: str):
+    #letter frequencies of a file read in fixed size chunks, never loaded whole
+    try:
+        return letter_freq_stream(map_file(path))
+    except OSError as e:
+        print(f"Error: cannot read {path}: {e.strerror}")
+        return None
+
+def text_freq(ct) -> dict:
+    #in memory text as is, memory mapped files chunk by chunk
+    return letter_freq(ct) if isinstance(ct, str) else letter_freq_stream(ct)
+
+def text_sample(ct, limit: int = SAMPLE_BYTES) -> str:
+    #the text itself, or the first `limit` bytes of a memory mapped file
+    if isinstance(ct, str):
+        return ct
+    return bytes(ct[:limit]).decode("utf-8", errors="ignore")
+
+def cached_solve(source) -> tuple:
+    #(cache, fingerprint, cached result or None) of a ciphertext, cache is None when the cache file cannot be used
+    try:
+        from cipherCache import SolveCache, fingerprint
+        if "db" not in _cache:
+            _cache["db"] = SolveCache()
+        fp = fingerprint(source)
+        return _cache["db"], fp, _cache["db"].get(fp)
+    except Exception as e:
+        print(f"Warning: solve cache unavailable ({e}).")
+        return None, None, None
+
 def print_help():
     print("\nAvailable Commands")
-    print("  load            - Enter a new ciphertext")
-    print("  mapbyfreq       - map automatically by letter frequencies")
+    print("  load [F]        - Enter a new ciphertext (or memory map file F)")
+    print("  mapbyfreq [F]   - map automatically by letter frequencies (of the loaded text or of file F)")
+    print("  solve [refine] [steepest] - crack automatically (frequency seed + hill climbing), known ciphertexts come from the cache,")
+    print("                    refine searches longer and updates the cache when it finds a better key,")
+    print("                    steepest always takes the best swap (deterministic, same key every run)")
+    print("  patterns        - solve from word letter patterns (best on short messages)")
+    print("  exact [S] [words] - branch and bound search for the provably best key (short messages, S seconds, default 10),")
+    print("                    words only searches keys that agree with the dictionary word patterns")
+    print("  build-model     - (re)build the cached english n-gram model used by solve")
     print("  assoc <L1> <L2> - Associate two letters (e.g., 'assoc A E')")
     print("  reset           - Reset the mapping to defaults")
-    print("  show            - Display the current mapping, trigrams, and decrypted output")
-    print("  graph           - Open the letter frequency bar chart")
+    print("  undo [N]        - Undo the last (N) changes to the mapping")
+    print("  redo [N]        - Redo the last (N) undone changes")
+    print("  save [NAME]     - Save the mapping as checkpoint NAME (lists checkpoints without NAME)")
+    print("  restore NAME    - Go back to checkpoint NAME")
+    print("  show            - Display the current mapping, trigrams, bigrams, double letters and decrypted output")
+    print("  graph [F]       - Open the letter frequency bar chart (of the loaded text or of file F)")
+    print("  decode [F]      - Decode the whole ciphertext into file F (or to the screen)")
     print("  check           - Check if the current mapping is perfectly reciprocal")
     print("  help            - Show this menu")
     print("  quit / exit     - Exit the program")
 
 def main():
+    #--profile [PREFIX] or CIPHER_PROFILE=1 turns on timing of commands and hot paths
+    setup()
     print("Reciprocal Cipher Cracker")
     print('Type "help" for a list of commands.')
     
     ct = ""
     #initialize mapping of all letters to self i.e. a->a b->b etc
-    mapping = make_identity_pairs()
+    #history changes the mapping in place, so `mapping` is always the current key
+    history = KeyHistory(make_identity_pairs())
+    mapping = history.key
+    #decrypted text of the loaded ciphertext, patched per change instead of decoded again on every show
+    view = None
+    stats = None
     
     print_help()
     #crack loop 
@@ -235,75 +178,262 @@ def main():
             
         cmd = user_input[0].lower()
 
-        if cmd in ["quit", "exit"]:
-            print("Exiting...")
-            break
+        #per command timing, only recorded with --profile / CIPHER_PROFILE
+        with span(f"cmd {cmd}"):
+            if cmd in ["quit", "exit"]:
+                print("Exiting...")
+                #time per command and hot path, when profiling is on
+                report(sys.stdout)
+                break
             
-        elif cmd == "help":
-            print_help()
+            elif cmd == "help":
+                print_help()
             
-        elif cmd == "load":
-            print("Enter your ciphertext (press Enter to finish):")
-            ct = input(">> ").strip()
-            print("Ciphertext loaded successfully.")
+            elif cmd == "load":
+                if len(user_input) > 1:
+                    try:
+                        ct = map_file(user_input[1])
+                    except OSError as e:
+                        print(f"Error: cannot read {user_input[1]}: {e.strerror}")
+                        continue
+                    view = None
+                    print(f"Ciphertext mapped from {user_input[1]} ({len(ct)} bytes).")
+                    continue
+                print("Enter your ciphertext (press Enter to finish):")
+                ct = input(">> ").strip()
+                view = None
+                print("Ciphertext loaded successfully.")
             
-        elif cmd == "mapbyfreq":
-            if not ct:
-                print("Error: You must load a ciphertext first.")
-            else:
-                mapping = initial_reciprocal_mapping_by_frequency(ct.upper())
-                print("Mapping by frequency.")
+            elif cmd == "mapbyfreq":
+                if len(user_input) > 1:
+                    try:
+                        source = map_file(user_input[1])
+                    except OSError as e:
+                        print(f"Error: cannot read {user_input[1]}: {e.strerror}")
+                        continue
+                    label = f" of {user_input[1]}"
+                elif not ct:
+                    print("Error: You must load a ciphertext first.")
+                    continue
+                else:
+                    source, label = ct, ""
+                #a ciphertext solved before gets its solved key straight away
+                _, _, hit = cached_solve(source)
+                if hit is not None:
+                    history.replace(key_from_string(hit["key"]))
+                    print(f"Known ciphertext{label}: cached solve applied (score {hit['score']:.2f}).")
+                else:
+                    history.replace(mapping_by_frequency(text_freq(source)))
+                    print(f"Mapping by frequency{label}.")
+
+            elif cmd == "solve":
+                options = {w.lower() for w in user_input[1:]}
+                refine = "refine" in options
+                method = "steepest" if "steepest" in options else "anneal"
+                if not ct:
+                    print("Error: You must load a ciphertext first.")
+                    continue
+                cache, fp, hit = cached_solve(ct)
+                if hit is not None and not refine:
+                    history.replace(key_from_string(hit["key"]))
+                    print(f"Known ciphertext: cached key applied (score {hit['score']:.2f}), 'solve refine' searches for a better one.")
+                    continue
+                #imported on first use, keeps startup light
+                from cipherSolver import REFINE_ITERATIONS, REFINE_RESTARTS, solve_parallel
+                from cipherWords import coverage
+                print("Solving... (this can take a few seconds)")
+                sample = text_sample(ct)
+                try:
+                    if refine:
+                        best, score = solve_parallel(sample, restarts=REFINE_RESTARTS, iterations=REFINE_ITERATIONS,
+                                                     target=None, method=method)
+                    else:
+                        best, score = solve_parallel(sample, method=method)
+                except Exception as e:
+                    print(f"Error: solve failed ({e}), mapping unchanged.")
+                    continue
+                plain = decode(sample, best)
+                if cache is not None and not cache.put(fp, key_string(best), coverage(plain)[1], score, plain, method) \
+                        and hit is not None:
+                    #this run did not beat what an earlier one found
+                    history.replace(key_from_string(hit["key"]))
+                    print(f"No improvement on the cached key (score {hit['score']:.2f}), keeping it.")
+                else:
+                    history.replace(best)
+                    print(f"Best key found, score {score:.2f}. Type 'show' to see it.")
                 
-        elif cmd == "reset":
-            mapping = make_identity_pairs()
-            print("Mapping reset to identity pairs.")
+            elif cmd == "patterns":
+                if not ct:
+                    print("Error: You must load a ciphertext first.")
+                else:
+                    from cipherWords import solve_by_patterns
+                    try:
+                        best, solved = solve_by_patterns(text_sample(ct))
+                    except Exception as e:
+                        print(f"Error: pattern solve failed ({e}), mapping unchanged.")
+                        continue
+                    history.replace(best)
+                    print(f"Pattern solve pinned down {len(solved)} of 26 letters. Type 'show' to see it.")
+
+            elif cmd == "exact":
+                options = [w.lower() for w in user_input[1:]]
+                budget = [w for w in options if w != "words"]
+                if not ct:
+                    print("Error: You must load a ciphertext first.")
+                    continue
+                try:
+                    limit = float(budget[0]) if budget else EXACT_SECONDS
+                except ValueError:
+                    print("Usage: exact [seconds] [words]")
+                    continue
+                from cipherExact import solve_exact
+                print(f"Searching exactly for up to {limit:g} seconds...")
+                try:
+                    best, score, proven = solve_exact(text_sample(ct), time_limit=limit, words="words" in options)
+                except Exception as e:
+                    print(f"Error: exact search failed ({e}), mapping unchanged.")
+                    continue
+                history.replace(best)
+                if proven:
+                    print(f"Best key under the model, score {score:.2f}. Type 'show' to see it.")
+                else:
+                    print(f"Time is up, best key so far scores {score:.2f} (not proven). Type 'show' to see it.")
+
+            elif cmd == "build-model":
+                from cipherModel import CACHE_DIR, build_model
+                build_model()
+                print(f"N-gram model rebuilt into {CACHE_DIR}")
+
+            elif cmd == "reset":
+                history.replace(make_identity_pairs())
+                print("Mapping reset to identity pairs ('undo' brings the old one back).")
+
+            elif cmd in ["undo", "redo"]:
+                steps = history.undo if cmd == "undo" else history.redo
+                try:
+                    n = int(user_input[1]) if len(user_input) > 1 else 1
+                except ValueError:
+                    print(f"Usage Error: Please use format '{cmd} [N]'")
+                    continue
+                done = 0
+                while done < n and steps():
+                    done += 1
+                if done:
+                    print(f"{cmd.capitalize()}: {done} change(s).")
+                else:
+                    print(f"Nothing to {cmd}.")
+
+            elif cmd == "save":
+                if len(user_input) > 1:
+                    history.save(user_input[1])
+                    print(f"Checkpoint '{user_input[1]}' saved.")
+                elif history.checkpoints:
+                    print("Checkpoints: " + ", ".join(history.checkpoints))
+                else:
+                    print("No checkpoints yet, use 'save NAME'.")
+
+            elif cmd == "restore":
+                if len(user_input) != 2:
+                    print("Usage Error: Please use format 'restore NAME'")
+                elif user_input[1] not in history.checkpoints:
+                    print(f"Error: no checkpoint named '{user_input[1]}'.")
+                else:
+                    history.restore(user_input[1])
+                    print(f"Mapping restored to checkpoint '{user_input[1]}'.")
             
-        elif cmd in ["assoc", "a"]:
-            if len(user_input) != 3:
-                print("Usage Error: Please use format 'assoc A B'")
-                continue
-
-            associate(mapping, user_input[1], user_input[2])
-            print(f"Associated '{user_input[1].upper()}' with '{user_input[2].upper()}'.")
+            elif cmd in ["assoc", "a"]:
+                if len(user_input) != 3:
+                    print("Usage Error: Please use format 'assoc A B'")
+                    continue
+
+                try:
+                    history.associate(user_input[1], user_input[2])
+                except ValueError as e:
+                    print(f"Error: {e}")
+                    continue
+                print(f"Associated '{user_input[1].upper()}' with '{user_input[2].upper()}'.")
 
                 
-        elif cmd == "show":
-            if not ct:
-                print("No ciphertext loaded. Type 'load' first.")
-                continue
+            elif cmd == "show":
+                if not ct:
+                    print("No ciphertext loaded. Type 'load' first.")
+                    continue
             
 
-            print("\n[Current Mapping]")
-            #display mapping 
-            map_strs = [f"{c}->{mapping.get(c, c)}" for c in ALPHABET]
-            for i in range(0, 26, 6):
-                print("  " + "   ".join(map_strs[i:i+6]))
-
-            #display current decoding step
-            plain = decode(ct, mapping)
-            #display trigrams
-            trigs = top_trigrams(plain, n=10)
-            print("\n[Top Trigrams (Decrypted)]")
-            if not trigs:
-                print("  No trigrams found (need at least 3 letters).")
-            else:
-                for i, (tri, k) in enumerate(trigs, start=1):
-                    print(f"  {i:2d}) {tri} -> {k}")
-                    
-
-            print("\n[Decrypted Output]")
-            print(plain)
+                print("\n[Current Mapping]")
+                #display mapping 
+                map_strs = [f"{c}->{mapping.get(c, c)}" for c in ALPHABET]
+                for i in range(0, 26, 6):
+                    print("  " + "   ".join(map_strs[i:i+6]))
+
+                #display current decoding step (files only from their first part)
+                if view is None:
+                    sample = text_sample(ct)
+                    view = DecodedView(sample, mapping)
+                    stats = ngram_stats(sample)
+                else:
+                    view.sync(mapping)
+                plain = view.text()
+                #n-grams of the ciphertext are counted once, the key only permutes them
+                table = key_table(mapping)
+                for title, grams, empty in (
+                        ("Top Trigrams (Decrypted)", stats.top(3, 10, table=table), "No trigrams found (need at least 3 letters)."),
+                        ("Top Bigrams (Decrypted)", stats.top(2, 10, table=table), "No bigrams found (need at least 2 letters)."),
+                        ("Double Letters (Decrypted)", stats.doubles(10, table=table), "No double letters inside words.")):
+                    print(f"\n[{title}]")
+                    if not grams:
+                        print(f"  {empty}")
+                    for i, (gram, k) in enumerate(grams, start=1):
+                        print(f"  {i:2d}) {gram} -> {k}")
+
+
+                #share of the output that already reads as dictionary words
+                from cipherWords import coverage
+                words, letters = coverage(plain)
+                print("\n[Dictionary Coverage]")
+                print(f"  words {words:.0%}   letters {letters:.0%}")
+
+                print("\n[Decrypted Output]")
+                if isinstance(ct, str):
+                    print(plain)
+                else:
+                    print(plain[:PREVIEW_CHARS])
+                    print(f"... (first {PREVIEW_CHARS} characters, use 'decode <file>' for all of it)")
 
             
-        elif cmd == "graph":
-            show_graph(ct)
+            elif cmd == "graph":
+                if len(user_input) > 1:
+                    freqs = file_freq(user_input[1])
+                    if freqs is not None:
+                        show_graph(freqs)
+                elif not ct or not text_sample(ct, PREVIEW_CHARS).strip():
+                    print("Error: Load ciphertext first before graphing.")
+                else:
+                    show_graph(text_freq(ct))
+
+            elif cmd == "decode":
+                if not ct:
+                    print("Error: You must load a ciphertext first.")
+                elif len(user_input) > 1:
+                    #straight from the (mapped) ciphertext to the file, chunk by chunk
+                    try:
+                        with open(user_input[1], "wb") as out:
+                            n = decode_stream(ct, out, mapping)
+                    except OSError as e:
+                        print(f"Error: cannot write {user_input[1]}: {e.strerror}")
+                        continue
+                    print(f"Wrote {n} bytes to {user_input[1]}.")
+                else:
+                    decode_stream(ct, sys.stdout.buffer, mapping)
+                    sys.stdout.flush()
+                    print()
             
-        elif cmd == "check":
-            ok = is_reciprocal(mapping)
-            print(f"Reciprocal Mapping OK? {ok}")
+            elif cmd == "check":
+                ok = is_reciprocal(mapping)
+                print(f"Reciprocal Mapping OK? {ok}")
             
-        else:
-            print("Unknown command. Type 'help' for options.")
+            else:
+                print("Unknown command. Type 'help' for options.")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,393 @@
+"""
+NumPy backend for the letter / n-gram counting and decoding hot paths
+
+The text is encoded once into a uint8 array of 0-25 letter codes (everything that is not A-Z / a-z is dropped),
+n-grams are packed as base 26 integers so a single np.bincount gives every count at once,
+and decoding a key is a lookup table gather instead of a per character python loop.
+
+"""
+import mmap
+import os
+from functools import lru_cache
+
+import numpy as np
+
+ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+NOT_LETTER = 255
+
+#byte -> letter code, both cases map to the same code, anything else is NOT_LETTER
+BYTE_CODES = np.full(256, NOT_LETTER, dtype=np.uint8)
+BYTE_CODES[np.frombuffer(ALPHABET.encode("ascii"), dtype=np.uint8)] = np.arange(26, dtype=np.uint8)
+BYTE_CODES[np.frombuffer(ALPHABET.lower().encode("ascii"), dtype=np.uint8)] = np.arange(26, dtype=np.uint8)
+
+UPPER_BYTES = np.frombuffer(ALPHABET.encode("ascii"), dtype=np.uint8)
+
+
+def text_bytes(text) -> np.ndarray:
+    #zero copy view for bytes like input, utf-8 encoding otherwise (multi byte chars are never letters)
+    if isinstance(text, str):
+        text = text.encode("utf-8")
+    return np.frombuffer(text, dtype=np.uint8)
+
+
+def encode(text) -> np.ndarray:
+    codes = BYTE_CODES[text_bytes(text)]
+    return codes[codes != NOT_LETTER]
+
+
+def letter_counts(codes: np.ndarray) -> np.ndarray:
+    return np.bincount(codes, minlength=26)
+
+
+def pack_ngrams(codes: np.ndarray, n: int) -> np.ndarray:
+    #base 26 index of every overlapping n-gram, first letter is the most significant digit
+    if len(codes) < n:
+        return np.zeros(0, dtype=np.int64)
+    packed = codes[:len(codes) - n + 1].astype(np.int64)
+    for i in range(1, n):
+        packed = packed * 26 + codes[i:len(codes) - n + 1 + i]
+    return packed
+
+
+#whitespace splits words, any other non letter (punctuation, digits) is dropped from inside the word
+WORD_CODES = BYTE_CODES.copy()
+WORD_CODES[np.frombuffer(b" \t\n\r\x0b\x0c", dtype=np.uint8)] = NOT_LETTER - 1
+WORD_GAP = NOT_LETTER - 1
+
+
+def encode_words(text) -> np.ndarray:
+    #letter codes with one WORD_GAP between words and at both ends
+    codes = WORD_CODES[text_bytes(text)]
+    codes = codes[codes != NOT_LETTER]
+    gap = codes == WORD_GAP
+    #collapse runs of whitespace so every word is framed by exactly one gap
+    keep = ~gap | np.r_[True, ~gap[:-1]]
+    return np.r_[WORD_GAP, codes[keep], WORD_GAP].astype(np.uint8)
+
+
+def gap_windows(gap: np.ndarray, n: int) -> np.ndarray:
+    #true for every n long window that touches a gap
+    bad = gap[:len(gap) - n + 1].copy()
+    for i in range(1, n):
+        bad |= gap[i:len(gap) - n + 1 + i]
+    return bad
+
+
+def pack_within(seq: np.ndarray, n: int) -> np.ndarray:
+    #packed n-grams lying entirely inside one word of a gap separated code sequence
+    if len(seq) < n:
+        return np.zeros(0, dtype=np.int64)
+    gap = seq >= 26
+    return pack_ngrams(np.where(gap, 0, seq).astype(np.uint8), n)[~gap_windows(gap, n)]
+
+
+def pack_whole_words(seq: np.ndarray, n: int) -> np.ndarray:
+    #packed codes of the words that are exactly n letters long (seq must start and end with a gap)
+    if len(seq) < n + 2:
+        return np.zeros(0, dtype=np.int64)
+    gap = seq >= 26
+    whole = ~gap_windows(gap[1:-1], n) & gap[:len(seq) - n - 1] & gap[n + 1:]
+    return pack_ngrams(np.where(gap[1:-1], 0, seq[1:-1]).astype(np.uint8), n)[whole]
+
+
+def unpack_codes(packed: np.ndarray, n: int) -> np.ndarray:
+    #inverse of pack_ngrams, (m, n) array of letter codes
+    powers = 26 ** np.arange(n - 1, -1, -1, dtype=np.int64)
+    return ((np.asarray(packed, dtype=np.int64)[:, None] // powers) % 26).astype(np.uint8)
+
+
+def unpack_ngram(index: int, n: int) -> str:
+    letters = []
+    for _ in range(n):
+        index, r = divmod(int(index), 26)
+        letters.append(ALPHABET[r])
+    return "".join(reversed(letters))
+
+
+def rank_ngrams(counts: np.ndarray, first: np.ndarray, n: int, k: int) -> list:
+    #k most common n-grams, ties keep first occurrence order, same as Counter.most_common
+    seen = np.flatnonzero(counts)
+    if len(seen) == 0:
+        return []
+    #only the n-grams that can still make the top k need a tie break
+    kth = np.sort(counts[seen])[::-1][min(k, len(seen)) - 1]
+    cand = seen[counts[seen] >= kth]
+    order = np.lexsort((first[cand], -counts[cand]))[:k]
+    return [(unpack_ngram(i, n), int(counts[i])) for i in cand[order]]
+
+
+def first_seen(packed: np.ndarray, n: int, offset: int = 0, first: np.ndarray = None) -> np.ndarray:
+    #index of the first occurrence of every n-gram (len(packed) + offset or more when never seen)
+    if first is None:
+        first = np.full(26 ** n, np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(first, packed, np.arange(offset, offset + len(packed), dtype=np.int64))
+    return first
+
+
+def top_ngrams(codes: np.ndarray, n: int, k: int = 10) -> list:
+    packed = pack_ngrams(codes, n)
+    if len(packed) == 0:
+        return []
+    return rank_ngrams(np.bincount(packed, minlength=26 ** n), first_seen(packed, n), n, k)
+
+
+def letter_freq(text) -> dict:
+    counts = letter_counts(encode(text))
+    total = int(counts.sum())
+    if total == 0:
+        return {c: 0.0 for c in ALPHABET}
+    return {c: float(counts[i] / total) for i, c in enumerate(ALPHABET)}
+
+
+def top_trigrams(text, n: int = 10) -> list:
+    return top_ngrams(encode(text), 3, n)
+
+
+class NgramStats:
+    """
+    Letter n-gram counts of one ciphertext for n = 1..4, in three modes, from a single encoded pass.
+
+    "overlap" counts every window of the letters with word breaks ignored (top_trigrams), "within" only the
+    windows inside one word and "word" only the words exactly n letters long (find_trigrams). Each (n, mode)
+    is counted and ranked on first use and kept. A reciprocal key only relabels letters, which changes neither
+    the counts nor the first occurrences, so the ranking of the decryption is the cipher ranking: top() just
+    relabels its first k rows through the key table (no decode, no recount, no 26 ** n arrays per call).
+    A table that sends two letters to one merges their n-grams and is ranked again over the seen ones only.
+    """
+
+    MODES = ("overlap", "within", "word")
+    MAX_N = 4
+
+    def __init__(self, text):
+        self.seq = encode_words(text)
+        self.codes = self.seq[self.seq < 26]
+        self._counts = {}
+        self._ranked = {}
+
+    def counts(self, n: int, mode: str = "overlap") -> tuple:
+        #(counts, first occurrence) arrays of length 26 ** n, of the ciphertext itself
+        if not 1 <= n <= self.MAX_N:
+            raise ValueError(f"n must be between 1 and {self.MAX_N}")
+        if mode not in self.MODES:
+            raise ValueError(f"mode must be one of {', '.join(self.MODES)}")
+        if (n, mode) not in self._counts:
+            if mode == "overlap":
+                packed = pack_ngrams(self.codes, n)
+            elif mode == "within":
+                packed = pack_within(self.seq, n)
+            else:
+                packed = pack_whole_words(self.seq, n)
+            self._counts[n, mode] = (np.bincount(packed, minlength=26 ** n), first_seen(packed, n))
+        return self._counts[n, mode]
+
+    def ranked(self, n: int, mode: str = "overlap") -> tuple:
+        #(letter codes (m, n), counts, first occurrences) of the m n-grams seen, most common first like rank_ngrams
+        if (n, mode) not in self._ranked:
+            counts, first = self.counts(n, mode)
+            seen = np.flatnonzero(counts)
+            seen = seen[np.lexsort((first[seen], -counts[seen]))]
+            self._ranked[n, mode] = (unpack_codes(seen, n), counts[seen], first[seen])
+        return self._ranked[n, mode]
+
+    def top(self, n: int, k: int = 10, mode: str = "overlap", table: np.ndarray = None) -> list:
+        return self._top(n, k, mode, table, False)
+
+    def doubles(self, k: int = 10, table: np.ndarray = None) -> list:
+        #most common double letters (LL, SS, EE ...) inside words, read off the within word bigrams
+        return self._top(2, k, "within", table, True)
+
+    def _top(self, n: int, k: int, mode: str, table, doubles: bool) -> list:
+        codes, counts, first = self.ranked(n, mode)
+        if table is not None:
+            table = np.asarray(table, dtype=np.uint8)
+            if np.bincount(table, minlength=26).max() > 1:
+                return self._merged(n, k, table[codes], counts, first, doubles)
+        if doubles:
+            keep = np.flatnonzero(codes[:, 0] == codes[:, 1])[:k]
+            codes, counts = codes[keep], counts[keep]
+        codes, counts = codes[:k], counts[:k]
+        if table is not None:
+            codes = table[codes]
+        return [(row.tobytes().decode("ascii"), int(c)) for row, c in zip(UPPER_BYTES[codes], counts)]
+
+    @staticmethod
+    def _merged(n: int, k: int, plain: np.ndarray, counts: np.ndarray, first: np.ndarray, doubles: bool) -> list:
+        #n-grams that decode alike are merged, only the seen ones are ranked
+        if doubles:
+            keep = plain[:, 0] == plain[:, 1]
+            plain, counts, first = plain[keep], counts[keep], first[keep]
+        if not len(plain):
+            return []
+        powers = 26 ** np.arange(n - 1, -1, -1, dtype=np.int64)
+        uniq, inv = np.unique(plain.astype(np.int64) @ powers, return_inverse=True)
+        merged = np.bincount(inv, weights=counts, minlength=len(uniq)).astype(np.int64)
+        merged_first = np.full(len(uniq), np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(merged_first, inv, first)
+        order = np.lexsort((merged_first, -merged))[:k]
+        return [(unpack_ngram(uniq[i], n), int(merged[i])) for i in order]
+
+
+@lru_cache(maxsize=8)
+def ngram_stats(text: str) -> NgramStats:
+    #one NgramStats per ciphertext, shared by every show / refresh of it
+    return NgramStats(text)
+
+
+def key_table(mapping: dict) -> np.ndarray:
+    #26 entry gather table: plain code = table[cipher code]
+    return np.array([ord(mapping.get(c, c)) - 65 for c in ALPHABET], dtype=np.uint8)
+
+
+def byte_table(mapping: dict) -> np.ndarray:
+    #256 entry version of key_table for DecodedView, letters come out upper case and the rest is untouched
+    lut = np.arange(256, dtype=np.uint8)
+    plain = UPPER_BYTES[key_table(mapping)]
+    lut[UPPER_BYTES] = plain
+    lut[UPPER_BYTES + 32] = plain
+    return lut
+
+
+class DecodedView:
+    """
+    Decrypted text of one ciphertext kept in step with a key that keeps changing.
+
+    The positions of every cipher letter are indexed once, sync() then rewrites only the bytes of the letters
+    whose partner changed (at most 4 per associate) instead of decoding the whole text again.
+    """
+
+    def __init__(self, text, mapping: dict):
+        data = text_bytes(text)
+        codes = BYTE_CODES[data]
+        #positions[c] = byte offsets of cipher letter c (either case)
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(27))
+        self.positions = [order[bounds[i]:bounds[i + 1]] for i in range(26)]
+        self.table = key_table(mapping)
+        self.plain = byte_table(mapping)[data]
+        self._text = None
+        self._chars = None
+
+    def sync(self, mapping: dict, changed=None) -> list:
+        #changed = letter codes whose partner moved, worked out from the last synced key when not given
+        table = key_table(mapping)
+        if changed is None:
+            changed = np.flatnonzero(table != self.table).tolist()
+        for i in changed:
+            self.plain[self.positions[i]] = UPPER_BYTES[table[i]]
+        self.table = table
+        if len(changed):
+            self._text = None
+        return list(changed)
+
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self.plain.tobytes().decode("utf-8")
+        return self._text
+
+    def char_offsets(self, changed) -> np.ndarray:
+        #sorted offsets in the decoded str (not bytes) of every letter in changed, for widgets indexed by character
+        if self._chars is None:
+            #character index of every byte: utf-8 continuation bytes belong to the character before them
+            self._chars = np.cumsum((self.plain & 0xC0) != 0x80) - 1
+        if not len(changed):
+            return np.zeros(0, dtype=np.int64)
+        return np.sort(self._chars[np.concatenate([self.positions[i] for i in changed])])
+
+
+class NgramAccumulator:
+    """
+    Letter and n-gram counts of a text fed in chunks, for inputs that do not fit in memory.
+
+    Memory is fixed (one count array per order plus first occurrence indexes), the last letters of each
+    chunk are carried over so n-grams spanning a chunk boundary are counted exactly once and the results
+    match letter_freq / top_trigrams on the whole text.
+    """
+
+    def __init__(self, orders=(1, 2, 3)):
+        self.orders = tuple(orders)
+        self.counts = {n: np.zeros(26 ** n, dtype=np.int64) for n in self.orders}
+        self.first = {n: np.full(26 ** n, np.iinfo(np.int64).max, dtype=np.int64) for n in self.orders}
+        self.tail = np.zeros(0, dtype=np.uint8)
+        #letters seen so far, also the stream position of the next letter
+        self.letters = 0
+
+    def update(self, chunk) -> None:
+        codes = encode(chunk)
+        if len(codes) == 0:
+            return
+        joined = np.concatenate([self.tail, codes])
+        for n in self.orders:
+            #n-grams lying only inside the carried tail were counted with the previous chunk
+            skip = max(len(self.tail) - n + 1, 0)
+            packed = pack_ngrams(joined, n)[skip:]
+            if len(packed) == 0:
+                continue
+            self.counts[n] += np.bincount(packed, minlength=26 ** n)
+            first_seen(packed, n, self.letters - len(self.tail) + skip, self.first[n])
+        self.letters += len(codes)
+        self.tail = joined[len(joined) - (max(self.orders) - 1):] if max(self.orders) > 1 else joined[:0]
+
+    def letter_freq(self) -> dict:
+        counts = self.counts[1]
+        if self.letters == 0:
+            return {c: 0.0 for c in ALPHABET}
+        return {c: float(counts[i] / self.letters) for i, c in enumerate(ALPHABET)}
+
+    def top(self, n: int, k: int = 10) -> list:
+        return rank_ngrams(self.counts[n], self.first[n], n, k)
+
+
+def iter_chunks(source, chunk_size: int = 1 << 20):
+    #in memory / memory mapped texts are sliced, file objects (text or binary) are read chunk by chunk,
+    #any other iterable is taken as chunks already
+    if isinstance(source, (str, bytes, bytearray, memoryview, mmap.mmap)):
+        for i in range(0, len(source), chunk_size):
+            yield source[i:i + chunk_size]
+    elif hasattr(source, "read"):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    else:
+        yield from source
+
+
+def accumulate(source, orders=(1, 2, 3), chunk_size: int = 1 << 20) -> NgramAccumulator:
+    acc = NgramAccumulator(orders)
+    for chunk in iter_chunks(source, chunk_size):
+        acc.update(chunk)
+    return acc
+
+
+def letter_freq_stream(source, chunk_size: int = 1 << 20) -> dict:
+    return accumulate(source, (1,), chunk_size).letter_freq()
+
+
+def top_trigrams_stream(source, n: int = 10, chunk_size: int = 1 << 20) -> list:
+    return accumulate(source, (3,), chunk_size).top(3, n)
+
+
+def map_file(path: str):
+    #read only memory map of a file, pages are only read in when touched (empty files give b"")
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def translate_table(mapping: dict) -> bytes:
+    #bytes.translate table, letters come out upper case and the rest is untouched like decode
+    plain = "".join(mapping.get(c, c) for c in ALPHABET).encode("ascii")
+    return bytes.maketrans((ALPHABET + ALPHABET.lower()).encode("ascii"), plain + plain)
+
+
+def decode_stream(source, out, mapping: dict, chunk_size: int = 1 << 20) -> int:
+    """Decode source chunk by chunk straight into the binary stream out, returns the bytes written."""
+    table = translate_table(mapping)
+    written = 0
+    for chunk in iter_chunks(source, chunk_size):
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        written += out.write(bytes(chunk).translate(table))
+    return written
@@ -0,0 +1,280 @@
+"""
+Dictionary word coverage of a decryption
+
+The words of words_alpha.txt are loaded once (lazily, on first use) into a frozenset so every lookup is a
+single hash probe. coverage() reports the fraction of whitespace separated tokens and the fraction of letters
+that belong to valid english words, WordCoverage keeps that result for one ciphertext and re-checks only the
+words holding a cipher letter whose partner changed.
+
+The same word list is also indexed by letter repetition pattern (XQQX and NOON are both ABBA), that index is
+persisted next to the n-gram model and drives solve_by_patterns, a word level constraint solver for short messages.
+
+"""
+import os
+import pickle
+import time
+from functools import lru_cache
+
+from cipherCore import ALPHABET, translation_table
+from cipherModel import CACHE_DIR, WORDS_PATH, source_stamp
+
+PATTERN_VERSION = 1
+#solve_by_patterns only searches this many words (most letters at stake first), which also bounds its recursion depth
+PATTERN_WORDS = 200
+
+
+@lru_cache(maxsize=1)
+def word_set() -> frozenset:
+    with open(WORDS_PATH, encoding="ascii") as f:
+        return frozenset(line.strip().upper() for line in f if line.strip())
+
+
+def tokens(text: str) -> list:
+    #whitespace separated words, upper case, with punctuation and digits stripped out
+    out = []
+    for raw in text.upper().split():
+        word = "".join(ch for ch in raw if ch in ALPHABET)
+        if word:
+            out.append(word)
+    return out
+
+
+def coverage(plain: str) -> tuple:
+    """(fraction of words, fraction of letters) of plain that are dictionary words."""
+    words = word_set()
+    toks = tokens(plain)
+    if not toks:
+        return 0.0, 0.0
+    good = [w for w in toks if w in words]
+    return len(good) / len(toks), sum(map(len, good)) / sum(map(len, toks))
+
+
+class WordCoverage:
+    """
+    Coverage of one ciphertext under a key, updated per associate move.
+
+    Identical cipher words are checked once and weighted by how often they occur, each cipher letter knows
+    which distinct words it appears in, so after a move only those words are decoded and looked up again.
+    """
+
+    def __init__(self, ct: str, mapping: dict):
+        self.words = word_set()
+        counts = {}
+        for w in tokens(ct):
+            counts[w] = counts.get(w, 0) + 1
+        self.cipher_words = list(counts)
+        self.counts = [counts[w] for w in self.cipher_words]
+        self.total_words = sum(self.counts)
+        self.total_letters = sum(len(w) * k for w, k in zip(self.cipher_words, self.counts))
+
+        #words_of[c] = ids of the distinct cipher words holding cipher letter c
+        self.words_of = {c: [] for c in ALPHABET}
+        for i, w in enumerate(self.cipher_words):
+            for ch in set(w):
+                self.words_of[ch].append(i)
+
+        self.mapping = dict(mapping)
+        table = translation_table(self.mapping)
+        self.valid = [w.translate(table) in self.words for w in self.cipher_words]
+        self.good_words = sum(k for k, ok in zip(self.counts, self.valid) if ok)
+        self.good_letters = sum(len(w) * k for w, k, ok in zip(self.cipher_words, self.counts, self.valid) if ok)
+
+    @property
+    def word_fraction(self) -> float:
+        return self.good_words / self.total_words if self.total_words else 0.0
+
+    @property
+    def letter_fraction(self) -> float:
+        return self.good_letters / self.total_letters if self.total_letters else 0.0
+
+    def update(self, mapping: dict, changed=None) -> tuple:
+        #changed = cipher letters whose partner moved, worked out from the old key when not given
+        if changed is None:
+            changed = [c for c in ALPHABET if mapping.get(c, c) != self.mapping.get(c, c)]
+        affected = set()
+        for c in changed:
+            affected.update(self.words_of[c.upper()])
+
+        table = translation_table(mapping)
+        for i in affected:
+            ok = self.cipher_words[i].translate(table) in self.words
+            if ok != self.valid[i]:
+                sign = 1 if ok else -1
+                self.good_words += sign * self.counts[i]
+                self.good_letters += sign * self.counts[i] * len(self.cipher_words[i])
+                self.valid[i] = ok
+        self.mapping = dict(mapping)
+        return self.word_fraction, self.letter_fraction
+
+
+def word_pattern(word: str) -> str:
+    #first new letter -> A, second new letter -> B ... so XQQX and NOON both give ABBA
+    seen = {}
+    return "".join(seen.setdefault(ch, ALPHABET[len(seen)]) for ch in word)
+
+
+def pattern_path(cache_dir: str = CACHE_DIR) -> str:
+    return os.path.join(cache_dir, f"patterns-v{PATTERN_VERSION}.pickle")
+
+
+def build_pattern_index(cache_dir: str = CACHE_DIR) -> dict:
+    index = {}
+    for w in sorted(word_set()):
+        index.setdefault(word_pattern(w), []).append(w)
+    index = {p: tuple(ws) for p, ws in index.items()}
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(pattern_path(cache_dir), "wb") as f:
+        pickle.dump({"stamp": source_stamp(WORDS_PATH), "version": PATTERN_VERSION, "index": index}, f,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+    return index
+
+
+@lru_cache(maxsize=1)
+def pattern_index() -> dict:
+    """pattern -> tuple of dictionary words with that pattern, loaded from the cache or built on first use."""
+    try:
+        with open(pattern_path(), "rb") as f:
+            saved = pickle.load(f)
+        if saved["stamp"] == source_stamp(WORDS_PATH) and saved["version"] == PATTERN_VERSION:
+            return saved["index"]
+    except (OSError, pickle.UnpicklingError, EOFError, KeyError):
+        pass
+    return build_pattern_index()
+
+
+def fits(cipher_word: str, plain_word: str, key: dict) -> bool:
+    #can cipher_word decode to plain_word without breaking the reciprocal partial key
+    for c, p in zip(cipher_word, plain_word):
+        if key.get(c, p) != p or key.get(p, c) != c:
+            return False
+    return True
+
+
+def extend(cipher_word: str, plain_word: str, key: dict) -> dict:
+    #fits() must hold, both directions are stored since the key is its own inverse
+    new = dict(key)
+    for c, p in zip(cipher_word, plain_word):
+        new[c] = p
+        new[p] = c
+    return new
+
+
+def candidates(cipher_word: str) -> list:
+    #same pattern and consistent with itself as a reciprocal key (AB -> BC would need B->C and B->A)
+    out = []
+    for p in pattern_index().get(word_pattern(cipher_word), ()):
+        key = {}
+        for c, ch in zip(cipher_word, p):
+            if key.get(c, ch) != ch or key.get(ch, c) != c:
+                break
+            key[c] = ch
+            key[ch] = c
+        else:
+            out.append(p)
+    return out
+
+
+def propagate(words: list, cands: dict, deadline: float = None) -> dict:
+    """
+    Letter domains by intersection: a cipher letter may only decode to letters that every candidate list
+    of every word holding it allows at that spot, and c -> p is only kept while p -> c is still possible.
+    Words are filtered by the domains in turn until nothing changes. A word whose list runs empty is taken
+    to be a non dictionary word (names, typos) and stops constraining anything.
+    Past deadline (time.monotonic()) the lists are returned as narrowed so far.
+    """
+    domains = {c: set(ALPHABET) for c in ALPHABET}
+    cands = {w: list(cs) for w, cs in cands.items() if cs}
+    changed = True
+    while changed:
+        changed = False
+        for w in words:
+            if deadline is not None and time.monotonic() > deadline:
+                return cands
+            if w not in cands:
+                continue
+            allowed = {}
+            for p in cands[w]:
+                for c, ch in zip(w, p):
+                    allowed.setdefault(c, set()).add(ch)
+            for c, options in allowed.items():
+                narrowed = domains[c] & options
+                if narrowed and narrowed != domains[c]:
+                    domains[c] = narrowed
+                    changed = True
+        #reciprocal: c can only become p when p can become c
+        for c in ALPHABET:
+            keep = {p for p in domains[c] if c in domains[p]}
+            if keep and keep != domains[c]:
+                domains[c] = keep
+                changed = True
+        for w in list(cands):
+            kept = [p for p in cands[w] if all(ch in domains[c] for c, ch in zip(w, p))]
+            if len(kept) != len(cands[w]):
+                changed = True
+                if kept:
+                    cands[w] = kept
+                else:
+                    del cands[w]
+    return cands
+
+
+def word_candidates(words: list, deadline: float = None) -> dict:
+    #candidates of every word in turn, the words not reached by deadline get none (they constrain nothing)
+    cands = {}
+    for w in words:
+        if deadline is not None and time.monotonic() > deadline:
+            break
+        cands[w] = candidates(w)
+    return cands
+
+
+def solve_by_patterns(ct: str, max_nodes: int = 50000, time_limit: float = 5.0, max_words: int = PATTERN_WORDS) -> tuple:
+    """
+    Word level solver: returns (mapping, solved letters) where mapping is a full reciprocal key
+    (letters the words never pinned down map to themselves) maximising the letters in dictionary words.
+    Only the max_words words with the most letters at stake are used. time_limit covers the whole call:
+    candidate lists and propagation get at most half of it, and when it runs out the best key so far is returned.
+    """
+    start = time.monotonic()
+    deadline = start + time_limit
+    counts = {}
+    for w in tokens(ct):
+        counts[w] = counts.get(w, 0) + 1
+    weight = {w: k * len(w) for w, k in counts.items()}
+    #words with the most letters at stake first, they are the ones worth the time when it runs short
+    words = sorted(counts, key=lambda w: -weight[w])[:max_words]
+    prepared = start + time_limit / 2
+    cands = propagate(words, word_candidates(words, prepared), prepared)
+
+    best = {"score": -1, "key": {}}
+    nodes = 0
+
+    def search(pending: list, key: dict, score: int) -> None:
+        nonlocal nodes
+        #forward checking: keep only the candidates still consistent with the key, words left with none drop out
+        live = []
+        for w, cs in pending:
+            kept = [p for p in cs if fits(w, p, key)]
+            if kept:
+                live.append((w, kept))
+        if score > best["score"]:
+            best["score"], best["key"] = score, key
+        #bound: even matching every word still possible cannot beat the best so far
+        if not live or score + sum(weight[w] for w, _ in live) <= best["score"]:
+            return
+        nodes += 1
+        if nodes > max_nodes or time.monotonic() > deadline:
+            return
+        #most constrained word next: fewest candidates left, then most letters at stake
+        pick = min(range(len(live)), key=lambda j: (len(live[j][1]), -weight[live[j][0]]))
+        w, cs = live[pick]
+        rest = live[:pick] + live[pick + 1:]
+        for p in cs:
+            search(rest, extend(w, p, key), score + weight[w])
+        #the word may also be something outside the dictionary
+        search(rest, key, score)
+
+    search(list(cands.items()), {}, 0)
+
+    mapping = {c: best["key"].get(c, c) for c in ALPHABET}
+    return mapping, set(best["key"])